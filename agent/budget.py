@@ -0,0 +1,83 @@
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+TERMINATION_REASONS = (
+    "answered",
+    "max_seconds",
+    "max_turns",
+    "max_input_tokens",
+    "max_output_tokens",
+    "max_tool_calls",
+)
+
+
+class QuestionBudget:
+    """Limits on the time, LLM turns, tokens and tool calls spent on one question.
+
+    Budgets are checked before every turn. Once one runs out the agent gets a single
+    last turn to submit its best answer, so a question ends with an answer and the
+    reason it stopped rather than an exception. A turn that is still running when the
+    time runs out is cancelled.
+    """
+
+    def __init__(
+        self,
+        max_seconds=600,
+        max_turns=12,
+        max_input_tokens=500000,
+        max_output_tokens=60000,
+        max_tool_calls=40,
+    ):
+        self.max_seconds = max_seconds
+        self.max_turns = max_turns
+        self.max_input_tokens = max_input_tokens
+        self.max_output_tokens = max_output_tokens
+        self.max_tool_calls = max_tool_calls
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_seconds=float(os.getenv("GAIA_QUESTION_MAX_SECONDS", 600)),
+            max_turns=int(os.getenv("GAIA_QUESTION_MAX_TURNS", 12)),
+            max_input_tokens=int(os.getenv("GAIA_QUESTION_MAX_INPUT_TOKENS", 500000)),
+            max_output_tokens=int(os.getenv("GAIA_QUESTION_MAX_OUTPUT_TOKENS", 60000)),
+            max_tool_calls=int(os.getenv("GAIA_QUESTION_MAX_TOOL_CALLS", 40)),
+        )
+
+    def remaining_seconds(self, state):
+        # A question without a start time is only just starting
+        if state.started_at is None:
+            return self.max_seconds
+        return self.max_seconds - (time.monotonic() - state.started_at)
+
+    def exceeded(self, state):
+        """The name of the first budget the question has used up, if any"""
+        if self.remaining_seconds(state) <= 0:
+            return "max_seconds"
+        if state.turns >= self.max_turns:
+            return "max_turns"
+        if state.input_tokens >= self.max_input_tokens:
+            return "max_input_tokens"
+        if state.output_tokens >= self.max_output_tokens:
+            return "max_output_tokens"
+        if state.tool_calls >= self.max_tool_calls:
+            return "max_tool_calls"
+        return None
+
+    def recursion_limit(self):
+        # Each turn is two graph steps (the model, then the tools), plus the last turn
+        return 2 * (self.max_turns + 1) + 2
+
+
+def get_usage(state, response):
+    """The state's running totals, updated with a model response"""
+    usage = getattr(response, "usage_metadata", None) or {}
+    return {
+        "turns": state.turns + 1,
+        "input_tokens": state.input_tokens + usage.get("input_tokens", 0),
+        "output_tokens": state.output_tokens + usage.get("output_tokens", 0),
+        "tool_calls": state.tool_calls + len(getattr(response, "tool_calls", [])),
+    }
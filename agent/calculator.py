@@ -0,0 +1,295 @@
+import ast
+import math
+import operator
+import statistics
+from decimal import Decimal, localcontext
+
+# Keeps a single expression from tying up the process, e.g. 9**9**9
+MAX_EXPONENT = 10000
+MAX_RESULT_BITS = 100000
+MAX_LIST_LENGTH = 1000000
+MAX_PRECISION = 1000
+# Results are returned to the model, so long ones are cut short
+MAX_RESULT_CHARACTERS = 500
+
+BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
+
+UNARY_OPERATORS = {
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+}
+
+CONSTANTS = {"pi": math.pi, "e": math.e}
+
+
+class CalculationError(Exception):
+    pass
+
+
+def sqrt(x):
+    return x.sqrt() if isinstance(x, Decimal) else math.sqrt(x)
+
+
+def check_list_length(values):
+    if len(values) > MAX_LIST_LENGTH:
+        raise CalculationError(f"list is longer than {MAX_LIST_LENGTH} items")
+    return values
+
+
+def checked_range(*args):
+    values = range(*[int(arg) for arg in args])
+    return list(check_list_length(values))
+
+
+def check_result_bits(bits):
+    if bits > MAX_RESULT_BITS:
+        raise CalculationError(f"result would be over {MAX_RESULT_BITS} bits")
+
+
+def get_bits(value):
+    """The size of an integer, as floats and Decimals can't grow without bound"""
+    return abs(value).bit_length() if isinstance(value, int) else 0
+
+
+def multiply(left, right):
+    if isinstance(left, int) and isinstance(right, int):
+        check_result_bits(get_bits(left) + get_bits(right))
+    return left * right
+
+
+def checked_prod(values):
+    total = 1
+    for value in values:
+        total = multiply(total, value)
+    return total
+
+
+def cumsum(values):
+    totals = []
+    total = 0
+    for value in values:
+        total += value
+        totals.append(total)
+    return totals
+
+
+# Applied to each item when given a list as their first argument
+ELEMENTWISE_FUNCTIONS = {
+    "abs": abs,
+    "round": round,
+    "sqrt": sqrt,
+    "exp": math.exp,
+    "log": math.log,
+    "log10": math.log10,
+    "log2": math.log2,
+    "floor": math.floor,
+    "ceil": math.ceil,
+    "sin": math.sin,
+    "cos": math.cos,
+    "tan": math.tan,
+    "radians": math.radians,
+    "degrees": math.degrees,
+}
+
+# Take a whole list
+AGGREGATE_FUNCTIONS = {
+    "sum": sum,
+    "fsum": math.fsum,
+    "prod": checked_prod,
+    "min": min,
+    "max": max,
+    "len": len,
+    "sorted": sorted,
+    "cumsum": cumsum,
+    "range": checked_range,
+    "mean": statistics.mean,
+    "median": statistics.median,
+    "mode": statistics.mode,
+    "stdev": statistics.stdev,
+    "pstdev": statistics.pstdev,
+    "variance": statistics.variance,
+    "pvariance": statistics.pvariance,
+}
+
+FUNCTION_NAMES = sorted([*ELEMENTWISE_FUNCTIONS, *AGGREGATE_FUNCTIONS])
+
+
+def elementwise(function, left, right):
+    """Apply a binary operator to two scalars, a list and a scalar, or two equal-length lists.
+
+    Lists of lists are combined item by item at every level, so the operator is only
+    ever applied to numbers and never repeats or concatenates a list.
+    """
+    if isinstance(left, list) and isinstance(right, list):
+        if len(left) != len(right):
+            raise CalculationError(
+                f"cannot combine lists of length {len(left)} and {len(right)}"
+            )
+        return [elementwise(function, a, b) for a, b in zip(left, right)]
+    if isinstance(left, list):
+        return [elementwise(function, a, right) for a in left]
+    if isinstance(right, list):
+        return [elementwise(function, left, b) for b in right]
+    return function(left, right)
+
+
+def apply_each(function, value):
+    """Apply a unary operator to a number or to every number in a (nested) list"""
+    if isinstance(value, list):
+        return [apply_each(function, item) for item in value]
+    return function(value)
+
+
+def power(base, exponent):
+    if abs(exponent) > MAX_EXPONENT:
+        raise CalculationError(f"exponent {exponent} is too large")
+    # Capping the exponent isn't enough when the base is itself huge
+    if isinstance(base, int) and isinstance(exponent, int) and exponent > 0:
+        check_result_bits(get_bits(base) * exponent)
+    return base**exponent
+
+
+# In place of the plain operators, to bound the size of their results
+CHECKED_OPERATORS = {ast.Mult: multiply, ast.Pow: power}
+
+
+class Calculator:
+    """Evaluates arithmetic expressions by walking their AST, never with eval.
+
+    Only numbers, lists, names assigned by earlier expressions and the functions above
+    are allowed. When precision is given, number literals are Decimals and arithmetic
+    is carried out in base 10 to that many significant digits, so 0.1 + 0.2 == 0.3.
+    """
+
+    def __init__(self, precision=None):
+        if precision is not None:
+            precision = min(max(int(precision), 1), MAX_PRECISION)
+        self.precision = precision
+        self.variables = {name: self.number(value) for name, value in CONSTANTS.items()}
+
+    def number(self, value):
+        if self.precision is not None and isinstance(value, (int, float)):
+            return Decimal(str(value))
+        if isinstance(value, list):
+            return [self.number(item) for item in value]
+        return value
+
+    def evaluate(self, node):
+        match node:
+            case ast.Constant(value=value) if isinstance(value, (int, float)):
+                return self.number(value)
+            case ast.Name(id=name):
+                if name not in self.variables:
+                    raise CalculationError(f"unknown name {name}")
+                return self.variables[name]
+            case ast.List(elts=items) | ast.Tuple(elts=items):
+                return check_list_length([self.evaluate(item) for item in items])
+            case ast.UnaryOp(op=op, operand=operand) if type(op) in UNARY_OPERATORS:
+                function = UNARY_OPERATORS[type(op)]
+                return apply_each(function, self.evaluate(operand))
+            case ast.BinOp(left=left, op=op, right=right) if (
+                type(op) in BINARY_OPERATORS
+            ):
+                function = CHECKED_OPERATORS.get(type(op), BINARY_OPERATORS[type(op)])
+                return elementwise(function, self.evaluate(left), self.evaluate(right))
+            case ast.Subscript(value=value, slice=index):
+                return self.evaluate_subscript(value, index)
+            case ast.Call(func=ast.Name(id=name), args=args, keywords=[]):
+                # math functions return floats, which don't mix with Decimals
+                return self.number(
+                    self.call(name, [self.evaluate(arg) for arg in args])
+                )
+            case _:
+                raise CalculationError(
+                    f"unsupported syntax {ast.unparse(node)!r}"
+                    f" (allowed functions: {', '.join(FUNCTION_NAMES)})"
+                )
+
+    def evaluate_subscript(self, value, index):
+        values = self.evaluate(value)
+        if not isinstance(values, list):
+            raise CalculationError("only lists can be indexed")
+        if isinstance(index, ast.Slice):
+            bounds = [
+                int(self.evaluate(bound)) if bound is not None else None
+                for bound in (index.lower, index.upper, index.step)
+            ]
+            return values[slice(*bounds)]
+        return values[int(self.evaluate(index))]
+
+    def call(self, name, args):
+        if name in ELEMENTWISE_FUNCTIONS:
+            function = ELEMENTWISE_FUNCTIONS[name]
+            if args and isinstance(args[0], list):
+                # round's ndigits, the only other argument, must be an int
+                rest = [int(arg) for arg in args[1:]]
+                return [function(item, *rest) for item in args[0]]
+            if name == "round" and len(args) > 1:
+                return function(args[0], int(args[1]))
+            return function(*args)
+        if name in AGGREGATE_FUNCTIONS:
+            return AGGREGATE_FUNCTIONS[name](*args)
+        raise CalculationError(
+            f"unknown function {name} (allowed functions: {', '.join(FUNCTION_NAMES)})"
+        )
+
+    def run(self, expression):
+        """Evaluate an expression or a `name = expression` assignment"""
+        try:
+            (statement,) = ast.parse(expression.strip()).body
+        except (SyntaxError, ValueError):
+            raise CalculationError("expected a single expression or assignment")
+
+        if isinstance(statement, ast.Assign):
+            if len(statement.targets) != 1 or not isinstance(
+                statement.targets[0], ast.Name
+            ):
+                raise CalculationError("can only assign to a single name")
+            name = statement.targets[0].id
+            value = self.evaluate(statement.value)
+            self.variables[name] = value
+            return name, value
+        if isinstance(statement, ast.Expr):
+            return None, self.evaluate(statement.value)
+        raise CalculationError("expected a single expression or assignment")
+
+    @staticmethod
+    def format_result(value):
+        text = str(value)
+        if len(text) > MAX_RESULT_CHARACTERS:
+            text = (
+                f"{text[:MAX_RESULT_CHARACTERS]}..."
+                f" ({len(text) - MAX_RESULT_CHARACTERS} more characters)"
+            )
+        return text
+
+    def run_all(self, expressions):
+        """Evaluate expressions in order, returning a result line for each"""
+        lines = []
+        with localcontext() as context:
+            if self.precision is not None:
+                context.prec = self.precision
+            for i, expression in enumerate(expressions, start=1):
+                try:
+                    name, value = self.run(expression)
+                    # Formatting can fail too, for an int with too many digits
+                    lines.append(f"{name or expression} = {self.format_result(value)}")
+                except (
+                    CalculationError,
+                    ArithmeticError,
+                    IndexError,
+                    TypeError,
+                    ValueError,
+                ) as e:
+                    lines.append(f"error in expression {i} ({expression}): {e}")
+                    # Later expressions may depend on this one, so stop here
+                    break
+        return "\n".join(lines)
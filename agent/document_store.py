@@ -0,0 +1,194 @@
+import logging
+import math
+import os
+import re
+import textwrap
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Attachments longer than this are indexed and searched instead of sent in full
+DOCUMENT_INLINE_MAX_CHARACTERS = int(
+    os.getenv("GAIA_DOCUMENT_INLINE_MAX_CHARACTERS", 20000)
+)
+# Lines longer than this (whole transcripts can be one line) are wrapped, so that
+# line numbers are a fine enough way to address any part of a document
+LINE_WIDTH = 200
+CHUNK_CHARACTERS = 1500
+PREVIEW_CHARACTERS = 2000
+MAX_OUTLINE_ENTRIES = 50
+MAX_READ_CHARACTERS = 8000
+SEARCH_RESULTS = 5
+
+# BM25 parameters, the usual defaults
+K1 = 1.5
+B = 0.75
+
+
+def tokenize(text):
+    return re.findall(r"\w+", text.lower())
+
+
+def split_lines(text):
+    lines = []
+    for line in text.splitlines():
+        if len(line) > LINE_WIDTH:
+            lines.extend(
+                textwrap.wrap(
+                    line, LINE_WIDTH, break_long_words=True, drop_whitespace=True
+                )
+            )
+        else:
+            lines.append(line)
+    return lines
+
+
+class Document:
+    """A long attachment split into chunks of whole lines, indexed with BM25.
+
+    Lines are numbered from 1, and every search result and range read is given with
+    its line numbers so the model can read around a match. Everything is local: no
+    network or embedding model is needed.
+    """
+
+    def __init__(self, name, text, chunk_characters=CHUNK_CHARACTERS):
+        self.name = name
+        self.characters = len(text)
+        self.lines = split_lines(text)
+        self.chunks = self.make_chunks(chunk_characters)
+
+        self.term_counts = [Counter(tokenize(text)) for _, _, text in self.chunks]
+        self.chunk_lengths = [sum(counts.values()) for counts in self.term_counts]
+        self.average_length = (
+            sum(self.chunk_lengths) / len(self.chunks) if self.chunks else 0
+        )
+        document_frequencies = Counter()
+        for counts in self.term_counts:
+            document_frequencies.update(counts.keys())
+        self.idf = {
+            term: math.log(1 + (len(self.chunks) - df + 0.5) / (df + 0.5))
+            for term, df in document_frequencies.items()
+        }
+        logger.info(
+            f"Indexed {name}: {len(self.lines)} lines in {len(self.chunks)} chunks"
+        )
+
+    def make_chunks(self, chunk_characters):
+        """(first line, last line, text) of runs of lines up to chunk_characters long"""
+        chunks = []
+        start = 0
+        size = 0
+        for i, line in enumerate(self.lines):
+            if size and size + len(line) > chunk_characters:
+                chunks.append((start + 1, i, "\n".join(self.lines[start:i])))
+                start, size = i, 0
+            size += len(line) + 1
+        if start < len(self.lines):
+            chunks.append((start + 1, len(self.lines), "\n".join(self.lines[start:])))
+        return chunks
+
+    def score(self, query_terms, chunk_index):
+        counts = self.term_counts[chunk_index]
+        length_norm = (
+            1 - B + B * self.chunk_lengths[chunk_index] / (self.average_length or 1)
+        )
+        score = 0.0
+        for term in query_terms:
+            frequency = counts.get(term, 0)
+            if frequency:
+                score += (
+                    self.idf[term]
+                    * frequency
+                    * (K1 + 1)
+                    / (frequency + K1 * length_norm)
+                )
+        return score
+
+    def search(self, query, limit=SEARCH_RESULTS):
+        query_terms = set(tokenize(query))
+        scores = [(self.score(query_terms, i), i) for i in range(len(self.chunks))]
+        matches = sorted(
+            [(score, i) for score, i in scores if score > 0], reverse=True
+        )[:limit]
+        if not matches:
+            return f"No passages of {self.name} match '{query}'."
+
+        # Shown in document order, which reads better than score order
+        passages = []
+        for _, i in sorted(matches, key=lambda match: match[1]):
+            first, last, text = self.chunks[i]
+            passages.append(f"Lines {first}-{last}:\n{text}")
+        return "\n\n".join(passages)
+
+    def read_range(self, start_line, end_line):
+        start_line = max(start_line, 1)
+        end_line = min(end_line, len(self.lines))
+        if start_line > end_line:
+            return f"{self.name} has lines 1 to {len(self.lines)}."
+
+        lines = []
+        size = 0
+        for number in range(start_line, end_line + 1):
+            line = f"{number}: {self.lines[number - 1]}"
+            if size and size + len(line) > MAX_READ_CHARACTERS:
+                lines.append(
+                    f"[Stopped before line {number}: at most {MAX_READ_CHARACTERS}"
+                    " characters are read at a time]"
+                )
+                break
+            lines.append(line)
+            size += len(line) + 1
+        return "\n".join(lines)
+
+    def outline(self):
+        """Line numbers of headings and sheets, as written by the file extractors"""
+        headings = [
+            f"{number}: {line}"
+            for number, line in enumerate(self.lines, start=1)
+            if line.startswith("# ")
+        ]
+        if len(headings) > MAX_OUTLINE_ENTRIES:
+            omitted = len(headings) - MAX_OUTLINE_ENTRIES
+            headings = headings[:MAX_OUTLINE_ENTRIES] + [f"[{omitted} more headings]"]
+        return headings
+
+    def summary(self):
+        """Header sent in place of the document's full text"""
+        preview = []
+        size = 0
+        for line in self.lines:
+            if size + len(line) > PREVIEW_CHARACTERS:
+                break
+            preview.append(line)
+            size += len(line) + 1
+
+        header = [
+            f"The attached document {self.name} is too long to include in full:"
+            f" it has {self.characters} characters in {len(self.lines)} lines."
+            " Use the search_document tool to find the passages relevant to the"
+            " question and the read_document_range tool to read lines by number.",
+        ]
+        outline = self.outline()
+        if outline:
+            header.append("Headings (line: heading):\n" + "\n".join(outline))
+        header.append(f"Lines 1-{len(preview)} of the document:\n" + "\n".join(preview))
+        return "\n\n".join(header)
+
+
+class DocumentStore:
+    """The indexed attachments of the questions being answered, by task id"""
+
+    def __init__(self):
+        self.documents = {}
+
+    def add(self, task_id, document):
+        self.documents[task_id] = document
+
+    def get(self, task_id):
+        return self.documents.get(task_id)
+
+    def remove(self, task_id):
+        self.documents.pop(task_id, None)
+
+
+document_store = DocumentStore()
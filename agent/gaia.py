@@ -1,31 +1,54 @@
 import logging
 import asyncio
-import time
 import math
+import time
 
 from pydantic import BaseModel
 from typing import Annotated, List
 
-from langchain_anthropic import ChatAnthropic, convert_to_anthropic_tool
-from langchain_core.messages import ToolMessage
+from langchain_anthropic import convert_to_anthropic_tool
+from langchain_core.callbacks import BaseCallbackManager
+from langchain_core.messages import HumanMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import tool, InjectedToolCallId
-from langchain_tavily import TavilySearch
 
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
 from langgraph.types import Command
 from langgraph.prebuilt import InjectedState, ToolNode
 
+from agent.budget import QuestionBudget, get_usage
+from agent.calculator import Calculator
+from agent.document_store import (
+    DOCUMENT_INLINE_MAX_CHARACTERS,
+    Document,
+    document_store,
+)
+from agent.message_history import (
+    add_cache_breakpoints,
+    compact_tool_results,
+    prompt_cache_stats,
+)
+from agent.rate_limiter import RateLimitedChatAnthropic
+from agent.turn_policy import (
+    DEFAULT_MAX_TOKENS,
+    DEFAULT_THINKING_TOKENS,
+    TurnPolicy,
+    get_call_kwargs,
+)
+from agent import web_search
+from agent.search_cache import CachedTavilySearch
 from utils.file_extractors import FileExtractor
+from utils.instrumentation import ToolTimingCallbackHandler, instrumentation
 
 
 logger = logging.getLogger(__name__)
 
-llm = ChatAnthropic(
+llm = RateLimitedChatAnthropic(
     model_name="claude-sonnet-4-20250514",
-    max_tokens=10000,
+    max_tokens=DEFAULT_MAX_TOKENS,
     timeout=None,
-    thinking={"type": "enabled", "budget_tokens": 8000},
+    thinking={"type": "enabled", "budget_tokens": DEFAULT_THINKING_TOKENS},
     model_kwargs={
         "extra_headers": {"anthropic-beta": "token-efficient-tools-2025-02-19"}
     },
@@ -36,6 +59,13 @@ class AgentState(BaseModel):
     question: dict
     final_agent_answer: dict | None
     messages: Annotated[list, add_messages]
+    # What the question has used of its budget so far
+    # Set by get_answer_record, or on the first turn when a run doesn't pass it
+    started_at: float | None = None
+    turns: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    tool_calls: int = 0
 
 
 @tool
@@ -75,6 +105,42 @@ def divide(x: float, y: float):
     return x / y
 
 
+@tool
+def evaluate(expressions: List[str], precision: int | None = None):
+    """Evaluates a whole calculation in one call. Pass every step as a list of expressions, evaluated in order. Each is either an expression or an assignment like `total = a + b`, and later expressions can use earlier names. Supports numbers, + - * / // % ** and parentheses, lists like [1, 2, 3] with element-wise arithmetic (lists with lists or numbers), indexing and slicing, pi and e, and the functions abs, round, sqrt, exp, log, log10, log2, floor, ceil, sin, cos, tan, radians, degrees (element-wise over lists), sum, fsum, prod, min, max, len, sorted, cumsum, range, mean, median, mode, stdev, pstdev, variance and pvariance. Set precision to a number of significant digits to calculate in exact decimal arithmetic instead of floating point. Returns the value of every expression."""
+    logger.info(f"Evaluating {expressions}")
+    return Calculator(precision=precision).run_all(expressions)
+
+
+@tool
+async def search_many(queries: List[str]):
+    """Searches the web for several queries at once and returns their merged results, listing each page only once. Use this instead of several separate searches whenever a question needs more than one query."""
+    logger.info(f"Searching for {queries}")
+    return await web_search.search_many(queries, tavily)
+
+
+@tool
+def search_document(query: str, state: Annotated[AgentState, InjectedState]):
+    """Searches the attached document for passages matching the query, and returns the best matches with their line numbers. Only for documents too long to be included in the question: search with the words you expect the relevant passage to contain."""
+    logger.info(f"Searching document for {query}")
+    document = document_store.get(state.question["task_id"])
+    if document is None:
+        return "There is no attached document to search."
+    return document.search(query)
+
+
+@tool
+def read_document_range(
+    start_line: int, end_line: int, state: Annotated[AgentState, InjectedState]
+):
+    """Reads lines start_line to end_line (inclusive, numbered from 1) of the attached document. Use it to read around a passage found with search_document, or to read a document section by section."""
+    logger.info(f"Reading document lines {start_line} to {end_line}")
+    document = document_store.get(state.question["task_id"])
+    if document is None:
+        return "There is no attached document to read."
+    return document.read_range(start_line, end_line)
+
+
 @tool
 def submit_final_answer(
     answer: str,
@@ -88,6 +154,7 @@ def submit_final_answer(
     answer_data = {
         "task_id": state.question["task_id"],
         "agent_answer": answer,
+        "termination_reason": "answered",
     }
 
     logger.info("Final answer written, updating state with final answer...")
@@ -104,94 +171,293 @@ def submit_final_answer(
     )
 
 
-tavily = TavilySearch(max_results=2)
-tools = [add, sum_array, subtract, multiply, divide, tavily, submit_final_answer]
-anthropic_tools = []
-for raw_tool in tools:
-    anthropic_tool = convert_to_anthropic_tool(raw_tool)
-    anthropic_tools.append(anthropic_tool)
+tavily = CachedTavilySearch(max_results=2)
+tools = [
+    evaluate,
+    tavily,
+    search_many,
+    search_document,
+    read_document_range,
+    submit_final_answer,
+]
+# The one-operation-per-call math tools evaluate replaced, which cost an LLM turn for
+# every operation. Kept to compare against, see benchmarks/llm_turns.py.
+legacy_tools = [add, sum_array, subtract, multiply, divide, tavily, submit_final_answer]
+
+# Indented as it was when written inline, so recorded calls still replay
+SYSTEM_PROMPT = """
+        You are a general AI assistant. I will ask you a question. Report your thoughts, and finish your answer by calling the submit_final_answer tool. YOUR FINAL ANSWER should be a number OR as few words as possible OR a comma separated list of numbers and/or strings. If you are asked for a number, don't use comma to write your number neither use units such as $ or percent sign unless specified otherwise. If you are asked for a string, don't use articles, neither abbreviations (e.g. for cities), and write the digits in plain text unless specified otherwise. If you are asked for a comma separated list, apply the above rules depending of whether the element to be put in the list is a number or a string.
+        To operate effectively, always remember:
+            1. Before using the evaluate tool, make sure you have thought about the math problem sufficiently and stated the equations that you will solve. Plan every step first, then solve the whole calculation precisely with a single evaluate call.
+            2.Pay careful attention to the required output format of your answer and be sure to adjust your answer accordingly.
+            3. When you need several searches, make them all at once with search_many. Tool calls made in the same turn run in parallel, so call independent tools together.
+        """
+
+# The prompt that went with the legacy tools, for a fair comparison against them
+LEGACY_SYSTEM_PROMPT = """
+        You are a general AI assistant. I will ask you a question. Report your thoughts, and finish your answer by calling the submit_final_answer tool. YOUR FINAL ANSWER should be a number OR as few words as possible OR a comma separated list of numbers and/or strings. If you are asked for a number, don't use comma to write your number neither use units such as $ or percent sign unless specified otherwise. If you are asked for a string, don't use articles, neither abbreviations (e.g. for cities), and write the digits in plain text unless specified otherwise. If you are asked for a comma separated list, apply the above rules depending of whether the element to be put in the list is a number or a string.
+        To operate effectively, always remember:
+            1. Before using any math tools for operations, make sure you have thought about the math problem sufficiently and stated the equation that you will solve. Plan the equation first, then use the math tools to solve it precisely.
+            2.Pay careful attention to the required output format of your answer and be sure to adjust your answer accordingly.
+        """
 
-# To cache all tools we add the cache control block to the last tool
-anthropic_tools[-1]["cache_control"] = {"type": "ephemeral"}
-llm_with_tools = llm.bind_tools(anthropic_tools)
 
+def bind_tools(graph_tools):
+    anthropic_tools = []
+    for raw_tool in graph_tools:
+        anthropic_tool = convert_to_anthropic_tool(raw_tool)
+        anthropic_tools.append(anthropic_tool)
+
+    # To cache all tools we add the cache control block to the last tool
+    anthropic_tools[-1]["cache_control"] = {"type": "ephemeral"}
+    return llm.bind_tools(anthropic_tools)
+
+
+llm_with_tools = bind_tools(tools)
+
+
+FINAL_TURN_SECONDS = 120
+FINAL_TURN_PROMPT = (
+    "You have run out of your {reason} budget for this question. Do not use any"
+    " other tools: call submit_final_answer now with your best answer."
+)
 
-class GaiaAgent:
-    def __init__(self, *, handle_message_chunk=None):
-        self.handle_message_chunk = handle_message_chunk
-        self.llm = llm_with_tools
-        self.agent_graph = self.compile_graph()
 
-    def compile_graph(self):
-        graph = StateGraph(AgentState)
+async def submit_out_of_budget(state, llm, messages, reason, turn_policy):
+    """One last turn, asking the model to submit its best answer straight away.
 
-        def should_continue(state):
-            logger.info(
-                "Checking for final answer in decide_next_node conditional edge"
+    The model can't be forced to call submit_final_answer with tool_choice while
+    extended thinking is enabled, so it is asked to. Its answer is taken from the
+    response rather than by running the tools, and the question ends either way.
+    """
+    logger.warning(
+        f"Question {state.question['task_id']} ran out of its {reason} budget,"
+        " asking for a final answer"
+    )
+    request = HumanMessage(FINAL_TURN_PROMPT.format(reason=reason))
+    answer = "I don't know!"
+    try:
+        async with asyncio.timeout(FINAL_TURN_SECONDS):
+            response = await llm.ainvoke(
+                add_cache_breakpoints([*messages, request]),
+                **get_call_kwargs(turn_policy.get_final_turn_settings()),
             )
-            logger.info(state.final_agent_answer)
-            if state.final_agent_answer:
-                logger.info("Final answer submitted. Ending agent flow.")
-                return END
-            else:
-                logger.info("No final answer submitted yet, proceed to the tool nodes.")
-                return "tools"
-
-        graph.add_node(self.consider_question)
-        graph.add_node("tools", ToolNode(tools))
-
-        graph.add_edge(START, "consider_question")
-        graph.add_edge("tools", "consider_question")
-        graph.add_conditional_edges(
-            "consider_question", should_continue, ["tools", END]
-        )
-        return graph.compile()
-
-    async def consider_question(self, state: AgentState):
-        """Home of the agent. Looks at all the messages so far, generates the next message."""
-        logger.info("Considering question...")
-        time.sleep(5)  # Avoid hitting rate limits on the Claude API
-        if state.final_agent_answer is None:
-            messages = state.messages
-            response = await self.llm.ainvoke(messages)
-            return {"messages": [response]}
-        else:
-            # If a final answer has been determined no more consideration is required
-            logger.info(
-                "Skipping question consideration because final answer is available"
+    except TimeoutError:
+        logger.error("Final turn timed out")
+        return {
+            "messages": [request],
+            "final_agent_answer": {
+                "task_id": state.question["task_id"],
+                "agent_answer": answer,
+                "termination_reason": reason,
+            },
+        }
+
+    prompt_cache_stats.record(response)
+    instrumentation.observe_usage("turn", response)
+    for tool_call in response.tool_calls:
+        if tool_call["name"] == "submit_final_answer":
+            answer = tool_call["args"].get("answer", answer)
+    logger.info(f"Submitting final answer: {answer}")
+    return {
+        "messages": [request, response],
+        "final_agent_answer": {
+            "task_id": state.question["task_id"],
+            "agent_answer": answer,
+            "termination_reason": reason,
+        },
+        **get_usage(state, response),
+    }
+
+
+async def consider_question(state: AgentState, config: RunnableConfig):
+    """Home of the agent. Looks at all the messages so far, generates the next message."""
+    logger.info("Considering question...")
+    if state.final_agent_answer is None:
+        if state.started_at is None:
+            state = state.model_copy(update={"started_at": time.monotonic()})
+        messages = state.messages
+        # Compacted messages keep their ids, so returning them replaces the
+        # originals in the state as well
+        compacted = compact_tool_results(messages)
+        if compacted:
+            replacements = {message.id: message for message in compacted}
+            messages = [replacements.get(message.id, message) for message in messages]
+        llm = config["configurable"].get("llm", llm_with_tools)
+        budget = config["configurable"].get("budget") or QuestionBudget.from_env()
+        turn_policy = config["configurable"].get("turn_policy") or TurnPolicy.from_env()
+
+        reason = budget.exceeded(state)
+        if reason is None:
+            settings = turn_policy.get_turn_settings(state, budget)
+            instrumentation.observe("turn_thinking_budget_tokens", settings[0])
+            try:
+                async with asyncio.timeout(budget.remaining_seconds(state)):
+                    with instrumentation.timer("consider_question_seconds"):
+                        response = await llm.ainvoke(
+                            add_cache_breakpoints(messages),
+                            **get_call_kwargs(settings),
+                        )
+            except TimeoutError:
+                reason = "max_seconds"
+        if reason is not None:
+            update = await submit_out_of_budget(
+                state, llm, messages, reason, turn_policy
             )
-            return state
+            update["messages"] = [*compacted, *update["messages"]]
+            return {**update, "started_at": state.started_at}
+
+        prompt_cache_stats.record(response)
+        instrumentation.observe_usage("turn", response)
+        return {
+            "messages": [*compacted, response],
+            "started_at": state.started_at,
+            **get_usage(state, response),
+        }
+    else:
+        # If a final answer has been determined no more consideration is required
+        logger.info("Skipping question consideration because final answer is available")
+        return state
+
+
+def should_continue(state):
+    logger.info("Checking for final answer in decide_next_node conditional edge")
+    logger.info(state.final_agent_answer)
+    if state.final_agent_answer:
+        logger.info("Final answer submitted. Ending agent flow.")
+        return END
+    else:
+        logger.info("No final answer submitted yet, proceed to the tool nodes.")
+        return "tools"
+
+
+def compile_graph(graph_tools=tools):
+    graph = StateGraph(AgentState)
+
+    graph.add_node(consider_question)
+    graph.add_node("tools", ToolNode(graph_tools))
+
+    graph.add_edge(START, "consider_question")
+    graph.add_edge("tools", "consider_question")
+    graph.add_conditional_edges("consider_question", should_continue, ["tools", END])
+    return graph.compile()
+
+
+# The graph holds no per-question state (the question lives in AgentState and the
+# rest arrives through the run config), so one compiled graph serves every question
+# and can be run concurrently from many coroutines.
+agent_graph = compile_graph()
 
-    async def answer_question(self, question):
+
+class GaiaAgent:
+    def __init__(
+        self,
+        *,
+        handle_message_chunk=None,
+        llm=None,
+        graph=None,
+        inline_max_characters=DOCUMENT_INLINE_MAX_CHARACTERS,
+        budget=None,
+        prefetcher=None,
+        turn_policy=None,
+        system_prompt=SYSTEM_PROMPT,
+    ):
+        self.handle_message_chunk = handle_message_chunk
+        self.llm = llm or llm_with_tools
+        self.agent_graph = graph or agent_graph
+        # Longer attachments are searched with the document tools instead of being
+        # re-sent with every turn
+        self.inline_max_characters = inline_max_characters
+        self.budget = budget or QuestionBudget.from_env()
+        self.tool_timer = ToolTimingCallbackHandler()
+        # Extracts attachments ahead of time in other processes, when given
+        self.prefetcher = prefetcher
+        self.turn_policy = turn_policy or TurnPolicy.from_env()
+        self.system_prompt = system_prompt
+
+    def get_run_config(self, config=None):
+        run_config = {
+            # The budget ends a question before the recursion limit is reached
+            "recursion_limit": max(30, self.budget.recursion_limit()),
+            "configurable": {
+                "llm": self.llm,
+                "budget": self.budget,
+                "turn_policy": self.turn_policy,
+            },
+            "callbacks": [self.tool_timer],
+        }
+        if config:
+            run_config.update(
+                {
+                    k: v
+                    for k, v in config.items()
+                    if k not in ("configurable", "callbacks")
+                }
+            )
+            run_config["configurable"].update(config.get("configurable", {}))
+            callbacks = config.get("callbacks")
+            if isinstance(callbacks, BaseCallbackManager):
+                # A manager is given instead of a list, so the timer joins its handlers
+                callbacks = callbacks.copy()
+                callbacks.add_handler(self.tool_timer)
+                run_config["callbacks"] = callbacks
+            elif callbacks:
+                run_config["callbacks"].extend(callbacks)
+        return run_config
+
+    async def answer_question(
+        self, question, *, handle_message_chunk=None, config=None
+    ):
+        record = await self.get_answer_record(
+            question, handle_message_chunk=handle_message_chunk, config=config
+        )
+        return record["agent_answer"]
+
+    async def get_answer_record(
+        self, question, *, handle_message_chunk=None, config=None
+    ):
+        """The agent's answer to a question, with the reason it stopped working on it"""
+        started_at = time.monotonic()
         file_contents = None
         question_text = question["question"]
         if question["file_name"]:
             try:
-                file_extractor = FileExtractor(question["file_name"])
-                file_contents = file_extractor()
-                question_text += "\n\nDocument contents:\n\n"
-                question_text += file_contents
+                if self.prefetcher:
+                    file_contents = await self.prefetcher.get(question["file_name"])
+                else:
+                    # Resolving and extracting the file (a Whisper transcription,
+                    # say) blocks, so it runs in a thread to keep the other
+                    # questions on the event loop going
+                    file_contents = await asyncio.to_thread(
+                        lambda: FileExtractor(question["file_name"])()
+                    )
+                if len(file_contents) <= self.inline_max_characters:
+                    question_text += "\n\nDocument contents:\n\n"
+                    question_text += file_contents
+                else:
+                    document = Document(question["file_name"], file_contents)
+                    document_store.add(question["task_id"], document)
+                    question_text += "\n\n" + document.summary()
             except Exception as e:
                 logger.error(f"Error: {e}")
-                return "I don't know - I can't handle this file!"
+                return {
+                    "task_id": question["task_id"],
+                    "agent_answer": "I don't know - I can't handle this file!",
+                    "termination_reason": "unsupported_file",
+                }
 
         logger.debug("Initializing agent state to answer question...")
-        system_prompt = """
-        You are a general AI assistant. I will ask you a question. Report your thoughts, and finish your answer by calling the submit_final_answer tool. YOUR FINAL ANSWER should be a number OR as few words as possible OR a comma separated list of numbers and/or strings. If you are asked for a number, don't use comma to write your number neither use units such as $ or percent sign unless specified otherwise. If you are asked for a string, don't use articles, neither abbreviations (e.g. for cities), and write the digits in plain text unless specified otherwise. If you are asked for a comma separated list, apply the above rules depending of whether the element to be put in the list is a number or a string.
-        To operate effectively, always remember:
-            1. Before using any math tools for operations, make sure you have thought about the math problem sufficiently and stated the equation that you will solve. Plan the equation first, then use the math tools to solve it precisely.
-            2.Pay careful attention to the required output format of your answer and be sure to adjust your answer accordingly.
-        """
         initial_state = {
             "question": question,
             "final_agent_answer": None,
+            "started_at": started_at,
             "messages": [
                 {
                     "role": "system",
                     "content": [
                         {
                             "type": "text",
-                            "text": system_prompt,
+                            "text": self.system_prompt,
                             "cache_control": {"type": "ephemeral"},
                         }
                     ],
@@ -203,24 +469,38 @@ class GaiaAgent:
             ],
         }
 
+        handle_message_chunk = handle_message_chunk or self.handle_message_chunk
+        run_config = self.get_run_config(config)
+
         async def get_final_answer(agent):
             final_output: dict | None = None
             async for mode, chunk in agent.astream(
                 initial_state,
                 stream_mode=["values", "messages"],
-                config={"recursion_limit": 30},
+                config=run_config,
             ):
                 if mode == "values":
                     final_output = chunk
-                if mode == "messages" and self.handle_message_chunk:
-                    self.handle_message_chunk(chunk)
-
-            if final_output is None:
-                return "I don't know!"
-
-            return final_output["final_agent_answer"]["agent_answer"]
-
-        result = await get_final_answer(self.agent_graph)
+                if mode == "messages" and handle_message_chunk:
+                    handle_message_chunk(chunk)
+
+            if final_output is not None:
+                instrumentation.observe("question_turns", final_output["turns"])
+            if final_output is None or final_output["final_agent_answer"] is None:
+                return {
+                    "task_id": question["task_id"],
+                    "agent_answer": "I don't know!",
+                    "termination_reason": "no_answer",
+                }
+
+            return final_output["final_agent_answer"]
+
+        try:
+            with instrumentation.timer("question_seconds"):
+                result = await get_final_answer(self.agent_graph)
+        finally:
+            document_store.remove(question["task_id"])
+        instrumentation.increment(f"termination_{result['termination_reason']}")
         return result
 
     def __call__(self, question):
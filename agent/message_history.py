@@ -0,0 +1,157 @@
+import logging
+import os
+
+from langchain_core.messages import AIMessage, ToolMessage
+
+from agent.rate_limiter import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# The API allows at most 4 cache breakpoints per request. One is on the last tool
+# definition and one on the system prompt, leaving two for the conversation.
+MAX_CACHE_BREAKPOINTS = 4
+TOOL_CACHE_BREAKPOINTS = 1
+CACHE_CONTROL = {"type": "ephemeral"}
+
+# Once the messages are estimated to pass this many tokens, the oldest tool results
+# are replaced with short stubs until they are back under COMPACTION_TARGET of it.
+# Compacting changes the start of the conversation, so the cached prefix after the
+# first compacted message is lost: going well under the budget keeps it rare.
+CONTEXT_MAX_TOKENS = int(os.getenv("GAIA_CONTEXT_MAX_TOKENS", 30000))
+COMPACTION_TARGET = 0.6
+MIN_COMPACTED_CHARACTERS = 1000
+
+
+def count_cache_breakpoints(messages):
+    return sum(
+        1
+        for message in messages
+        if isinstance(message.content, list)
+        for block in message.content
+        if isinstance(block, dict) and "cache_control" in block
+    )
+
+
+def with_cache_control(message):
+    """A copy of a message with a cache breakpoint after its content"""
+    if isinstance(message, ToolMessage):
+        content = [
+            {
+                "type": "tool_result",
+                "content": message.content,
+                "tool_use_id": message.tool_call_id,
+                "is_error": message.status == "error",
+                "cache_control": CACHE_CONTROL,
+            }
+        ]
+    elif isinstance(message.content, str):
+        content = [
+            {"type": "text", "text": message.content, "cache_control": CACHE_CONTROL}
+        ]
+    else:
+        content = list(message.content)
+        last_block = content[-1]
+        if isinstance(last_block, str):
+            last_block = {"type": "text", "text": last_block}
+        content[-1] = {**last_block, "cache_control": CACHE_CONTROL}
+    return message.model_copy(update={"content": content})
+
+
+def add_cache_breakpoints(messages):
+    """The messages with cache breakpoints on the newest message and on the newest
+    message of the previous turn.
+
+    The breakpoint on the newest message caches the whole conversation for the next
+    turn, which then reads it back from the breakpoint one turn older. The messages in
+    the state are left as they are, so the breakpoints move along with each turn.
+    """
+    available = (
+        MAX_CACHE_BREAKPOINTS
+        - TOOL_CACHE_BREAKPOINTS
+        - count_cache_breakpoints(messages)
+    )
+    last_response = max(
+        (i for i, message in enumerate(messages) if isinstance(message, AIMessage)),
+        default=None,
+    )
+    candidates = [len(messages) - 1]
+    if last_response:
+        candidates.append(last_response - 1)
+
+    messages = list(messages)
+    for i in candidates[: max(available, 0)]:
+        if messages[i].content:
+            messages[i] = with_cache_control(messages[i])
+    return messages
+
+
+def compact_tool_results(messages, max_tokens=CONTEXT_MAX_TOKENS):
+    """Stubs replacing the oldest tool results, once the messages are over max_tokens.
+
+    Only results the model has already responded to are compacted. The stubs keep the
+    ids of the messages they replace, so returning them from a node replaces the
+    originals in the state.
+    """
+    total = estimate_tokens(messages)
+    if total <= max_tokens:
+        return []
+
+    last_response = max(
+        (i for i, message in enumerate(messages) if isinstance(message, AIMessage)),
+        default=0,
+    )
+    compacted = []
+    for message in messages[:last_response]:
+        if total <= max_tokens * COMPACTION_TARGET:
+            break
+        if not isinstance(message, ToolMessage):
+            continue
+        size = len(str(message.content))
+        if size < MIN_COMPACTED_CHARACTERS:
+            continue
+        stub = (
+            f"[This {message.name} result ({size} characters) was removed to save"
+            " context after it was used. Call the tool again if it is needed.]"
+        )
+        compacted.append(message.model_copy(update={"content": stub}))
+        total -= (size - len(stub)) // 4
+    logger.info(f"Compacted {len(compacted)} tool results, ~{total} tokens remain")
+    return compacted
+
+
+class PromptCacheStats:
+    """Input tokens read from and written to the prompt cache, over every turn"""
+
+    def __init__(self):
+        self.input_tokens = 0
+        self.cache_read_input_tokens = 0
+        self.cache_creation_input_tokens = 0
+
+    def record(self, message):
+        usage = getattr(message, "usage_metadata", None) or {}
+        details = usage.get("input_token_details") or {}
+        input_tokens = usage.get("input_tokens", 0)
+        cache_read = details.get("cache_read") or 0
+        cache_creation = details.get("cache_creation") or 0
+        logger.info(
+            f"Turn input tokens: {input_tokens}, cache_read_input_tokens:"
+            f" {cache_read}, cache_creation_input_tokens: {cache_creation}"
+        )
+        self.input_tokens += input_tokens
+        self.cache_read_input_tokens += cache_read
+        self.cache_creation_input_tokens += cache_creation
+
+    def metrics(self):
+        return {
+            "input_tokens": self.input_tokens,
+            "cache_read_input_tokens": self.cache_read_input_tokens,
+            "cache_creation_input_tokens": self.cache_creation_input_tokens,
+            "prompt_cache_read_fraction": (
+                self.cache_read_input_tokens / self.input_tokens
+                if self.input_tokens
+                else 0
+            ),
+        }
+
+
+prompt_cache_stats = PromptCacheStats()
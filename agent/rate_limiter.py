@@ -0,0 +1,246 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from functools import cached_property
+
+import anthropic
+from langchain_anthropic import ChatAnthropic
+
+from utils.instrumentation import instrumentation
+
+logger = logging.getLogger(__name__)
+
+# Status codes after which the API asks us to back off: rate limited and overloaded
+BACKOFF_STATUS_CODES = (429, 529)
+# Used when an overloaded response doesn't say how long to wait
+DEFAULT_RETRY_AFTER_SECONDS = 5.0
+# Error responses the anthropic client retries, until it runs out of retries
+RETRYABLE_STATUS_CODES = (408, 409, 429)
+
+
+def estimate_tokens(messages):
+    """Roughly estimate the input tokens for a list of messages (~4 characters per token)"""
+    characters = 0
+    for message in messages:
+        content = (
+            message.get("content") if isinstance(message, dict) else message.content
+        )
+        characters += len(str(content))
+    return characters // 4
+
+
+def seconds_until(timestamp):
+    """Seconds from now until an RFC 3339 timestamp, as sent in the ratelimit reset headers"""
+    try:
+        reset_at = datetime.fromisoformat(timestamp)
+    except (TypeError, ValueError):
+        return None
+    return max((reset_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class TokenBucket:
+    """A continuously replenishing bucket, the same model the Anthropic API uses for its limits.
+
+    The balance is allowed to go negative: a reservation always succeeds and the caller
+    waits until the bucket would have refilled enough to cover it.
+    """
+
+    def __init__(self, capacity, per_seconds=60.0):
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.refill_rate = capacity / per_seconds
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        elapsed = now - self.updated
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_rate)
+        self.updated = now
+
+    def reserve(self, amount, now):
+        """Take amount from the bucket, returning the seconds until the balance is non-negative"""
+        self.refill(now)
+        self.tokens -= min(amount, self.capacity)
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.refill_rate
+
+    def debit(self, amount, now):
+        self.refill(now)
+        self.tokens -= amount
+
+    def sync(self, limit, remaining, reset_in, now):
+        """Replace the local estimate with the server's view of this limit"""
+        self.capacity = limit
+        self.tokens = float(remaining)
+        self.updated = now
+        if reset_in and limit > remaining:
+            # The bucket is back to full at the reset time
+            self.refill_rate = (limit - remaining) / reset_in
+        else:
+            self.refill_rate = limit / 60.0
+
+
+class RateLimiter:
+    """Process-wide limiter for Anthropic API requests, input tokens and output tokens.
+
+    Every agent awaits acquire() before a turn, which only sleeps when one of the
+    buckets is close to empty. The buckets start from configured per-minute limits and
+    are kept in sync with the anthropic-ratelimit-* headers of every response, and a
+    429/529 response pauses all callers for its retry-after period.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute=50,
+        input_tokens_per_minute=30000,
+        output_tokens_per_minute=8000,
+    ):
+        self.buckets = {
+            "requests": TokenBucket(requests_per_minute),
+            "input-tokens": TokenBucket(input_tokens_per_minute),
+            "output-tokens": TokenBucket(output_tokens_per_minute),
+        }
+        self.blocked_until = 0.0
+        self.wait_seconds = 0.0
+        self.waits = 0
+        self.backoff_responses = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            requests_per_minute=int(os.getenv("ANTHROPIC_REQUESTS_PER_MINUTE", 50)),
+            input_tokens_per_minute=int(
+                os.getenv("ANTHROPIC_INPUT_TOKENS_PER_MINUTE", 30000)
+            ),
+            output_tokens_per_minute=int(
+                os.getenv("ANTHROPIC_OUTPUT_TOKENS_PER_MINUTE", 8000)
+            ),
+        )
+
+    def reserve(self, input_tokens):
+        # There is no await between reading and updating the buckets, so concurrent
+        # callers on the event loop can't interleave here and no lock is needed.
+        now = time.monotonic()
+        return max(
+            self.blocked_until - now,
+            self.buckets["requests"].reserve(1, now),
+            self.buckets["input-tokens"].reserve(input_tokens, now),
+            # Output is unknown until the response arrives, so only wait for any
+            # deficit left by earlier responses to be replenished.
+            self.buckets["output-tokens"].reserve(0, now),
+        )
+
+    async def acquire(self, input_tokens=0):
+        """Wait, without blocking the event loop, until a request can be sent"""
+        wait = self.reserve(input_tokens)
+        waited = 0.0
+        while wait > 0:
+            logger.info(f"Waiting {wait:.2f}s for the Anthropic rate limit...")
+            self.waits += 1
+            self.wait_seconds += wait
+            waited += wait
+            await asyncio.sleep(wait)
+            # A 429 seen by another agent while we slept pushes the wait out further
+            wait = self.blocked_until - time.monotonic()
+        instrumentation.observe("rate_limit_acquire_wait_seconds", waited)
+
+    def record_usage(self, message):
+        """Debit the output tokens of a response, or of a streamed chunk of one"""
+        usage = getattr(message, "usage_metadata", None)
+        if usage:
+            self.buckets["output-tokens"].debit(
+                usage.get("output_tokens", 0), time.monotonic()
+            )
+
+    def update_from_headers(self, headers):
+        now = time.monotonic()
+        for name, bucket in self.buckets.items():
+            limit = headers.get(f"anthropic-ratelimit-{name}-limit")
+            remaining = headers.get(f"anthropic-ratelimit-{name}-remaining")
+            if limit is None or remaining is None:
+                continue
+            reset_in = seconds_until(headers.get(f"anthropic-ratelimit-{name}-reset"))
+            bucket.sync(int(limit), int(remaining), reset_in, now)
+
+    def back_off(self, retry_after):
+        self.backoff_responses += 1
+        self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+        logger.warning(f"Anthropic API asked us to back off for {retry_after:.2f}s")
+
+    async def observe_response(self, response):
+        """httpx response hook that keeps the limiter in sync with the API"""
+        self.update_from_headers(response.headers)
+        instrumentation.increment("llm_http_responses")
+        if (
+            response.status_code in RETRYABLE_STATUS_CODES
+            or response.status_code >= 500
+        ):
+            # Whether the client retries it isn't known here, as the last
+            # attempt's error is returned instead
+            instrumentation.increment("llm_error_responses")
+        if response.status_code in BACKOFF_STATUS_CODES:
+            try:
+                retry_after = float(response.headers.get("retry-after"))
+            except (TypeError, ValueError):
+                retry_after = DEFAULT_RETRY_AFTER_SECONDS
+            self.back_off(retry_after)
+
+    def metrics(self):
+        return {
+            "rate_limit_wait_seconds": self.wait_seconds,
+            "rate_limit_waits": self.waits,
+            "rate_limit_backoff_responses": self.backoff_responses,
+        }
+
+
+rate_limiter = RateLimiter.from_env()
+
+
+class RateLimitedChatAnthropic(ChatAnthropic):
+    """ChatAnthropic that waits on the shared rate limiter before every API request.
+
+    Limiting the request itself, rather than the agent turn, means turns answered
+    without calling the API (such as replayed recordings) don't use up the budget.
+    """
+
+    def _get_request_payload(self, input_, *, stop=None, **kwargs):
+        # ChatAnthropic puts its own thinking setting over one passed with the call,
+        # which is how a turn asks for a different budget
+        thinking = kwargs.pop("thinking", None)
+        payload = super()._get_request_payload(input_, stop=stop, **kwargs)
+        if thinking is not None:
+            payload["thinking"] = thinking
+        return payload
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await rate_limiter.acquire(estimate_tokens(messages))
+        start = time.perf_counter()
+        first_chunk = True
+        async for chunk in super()._astream(messages, stop, run_manager, **kwargs):
+            if first_chunk:
+                instrumentation.observe(
+                    "llm_time_to_first_token_seconds", time.perf_counter() - start
+                )
+                first_chunk = False
+            rate_limiter.record_usage(chunk.message)
+            yield chunk
+        instrumentation.observe("llm_request_seconds", time.perf_counter() - start)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.streaming:
+            # Streams through _astream, which is already limited
+            return await super()._agenerate(messages, stop, run_manager, **kwargs)
+        await rate_limiter.acquire(estimate_tokens(messages))
+        with instrumentation.timer("llm_request_seconds"):
+            result = await super()._agenerate(messages, stop, run_manager, **kwargs)
+        rate_limiter.record_usage(result.generations[0].message)
+        return result
+
+    @cached_property
+    def _async_client(self) -> anthropic.AsyncClient:
+        http_client = anthropic.DefaultAsyncHttpxClient(
+            event_hooks={"response": [rate_limiter.observe_response]}
+        )
+        return anthropic.AsyncClient(**self._client_params, http_client=http_client)
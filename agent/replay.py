@@ -0,0 +1,162 @@
+import hashlib
+import json
+import logging
+import os
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import (
+    AIMessageChunk,
+    message_chunk_to_message,
+    message_to_dict,
+    messages_from_dict,
+)
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import Runnable
+from langgraph.constants import TAG_NOSTREAM
+
+logger = logging.getLogger(__name__)
+
+RECORDINGS_DIRECTORY = os.path.join(
+    os.path.dirname(__file__), "../", "recordings", "llm"
+)
+REPLAY_MODES = ("record", "replay", "replay-or-record")
+
+
+class RecordingNotFound(Exception):
+    pass
+
+
+def canonical_message(message):
+    """The parts of a message that affect the model's response, without random ids"""
+    return {
+        "type": message.type,
+        "content": message.content,
+        "tool_calls": getattr(message, "tool_calls", None),
+        "tool_call_id": getattr(message, "tool_call_id", None),
+        "name": message.name,
+    }
+
+
+def model_parameters(model):
+    """Bound kwargs (tools, tool choice...) and identifying params of a chat model"""
+    parameters = {}
+    while hasattr(model, "bound"):
+        parameters.update(model.kwargs)
+        model = model.bound
+    parameters["model"] = getattr(model, "_identifying_params", type(model).__name__)
+    return parameters
+
+
+def message_to_chunk(message):
+    """A recorded response as the single chunk of a stream"""
+    return AIMessageChunk(
+        content=message.content,
+        tool_calls=message.tool_calls,
+        usage_metadata=message.usage_metadata,
+        response_metadata=message.response_metadata,
+        id=message.id,
+    )
+
+
+class RecordReplayChatModel(BaseChatModel):
+    """Records a chat model's responses to disk and replays them for identical calls.
+
+    Calls are keyed by a hash of the messages, the bound tools and the model
+    parameters. In record mode every call goes to the model and is saved, in replay
+    mode calls are only answered from recordings (a miss raises RecordingNotFound) and
+    replay-or-record replays when it can and records otherwise. Replaying needs no
+    network or API key, which makes it a local stand-in for the real model. When
+    streamed, a replayed response arrives as one chunk and a recorded one streams
+    through as the model sends it.
+    """
+
+    model: Runnable
+    mode: str = "replay-or-record"
+    directory: str = RECORDINGS_DIRECTORY
+    hits: int = 0
+    misses: int = 0
+
+    @property
+    def _llm_type(self):
+        return "record-replay"
+
+    def make_key(self, messages, call_kwargs=None):
+        parameters = model_parameters(self.model)
+        # Settings passed with the call, such as a turn's thinking budget, only
+        # appear in the key when given, so earlier recordings still match
+        if call_kwargs:
+            parameters.update(call_kwargs)
+        payload = {
+            "messages": [canonical_message(message) for message in messages],
+            "parameters": parameters,
+        }
+        encoded = json.dumps(payload, sort_keys=True, default=str)
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    def get_path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def load(self, key):
+        path = self.get_path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r") as f:
+            recording = json.load(f)
+        return messages_from_dict([recording["response"]])[0]
+
+    def save(self, key, messages, response):
+        path = self.get_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        recording = {
+            "messages": [canonical_message(message) for message in messages],
+            "response": message_to_dict(response),
+        }
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w") as f:
+            json.dump(recording, f, default=str)
+        os.replace(temporary_path, path)
+
+    def get_recorded(self, messages, kwargs):
+        """The key of a call and its recorded response, if it should be replayed"""
+        if self.mode not in REPLAY_MODES:
+            raise ValueError(f"Unknown replay mode {self.mode}")
+
+        key = self.make_key(messages, kwargs)
+        response = self.load(key) if self.mode != "record" else None
+        if response is not None:
+            logger.info(f"Replaying recorded response {key}")
+            self.hits += 1
+        elif self.mode == "replay":
+            raise RecordingNotFound(f"No recorded response for {key}")
+        else:
+            self.misses += 1
+        return key, response
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        key, response = self.get_recorded(messages, kwargs)
+        if response is None:
+            response = self.model.invoke(messages, **kwargs)
+            self.save(key, messages, response)
+        return ChatResult(generations=[ChatGeneration(message=response)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        key, response = self.get_recorded(messages, kwargs)
+        if response is None:
+            response = await self.model.ainvoke(messages, **kwargs)
+            self.save(key, messages, response)
+        return ChatResult(generations=[ChatGeneration(message=response)])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        """Replays a recorded response as a single chunk, or streams the model's"""
+        key, response = self.get_recorded(messages, kwargs)
+        if response is not None:
+            yield ChatGenerationChunk(message=message_to_chunk(response))
+            return
+
+        message = None
+        # The chunks are streamed from here, so LangGraph shouldn't stream them twice
+        config = {"tags": [TAG_NOSTREAM]}
+        async for chunk in self.model.astream(messages, config, **kwargs):
+            message = chunk if message is None else message + chunk
+            yield ChatGenerationChunk(message=chunk)
+        self.save(key, messages, message_chunk_to_message(message))
@@ -0,0 +1,272 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from functools import cache, partial
+
+from langchain_tavily import TavilySearch
+
+logger = logging.getLogger(__name__)
+
+CACHE_FILE = os.path.join(os.path.dirname(__file__), "../", "cache", "searches.sqlite3")
+SEARCH_CACHE_MODES = ("cache", "replay", "off")
+
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+
+def make_key(query, **parameters):
+    payload = {"query": normalize_query(query), **parameters}
+    encoded = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class SearchCache:
+    """Persistent cache of web search results shared by every agent in the process.
+
+    Results expire after ttl_seconds and the least recently used are evicted beyond
+    max_entries. Identical searches that are in flight at the same time share one
+    request. In replay mode the network is never used: cached results are returned
+    however old they are, and a miss returns an error to the agent.
+    """
+
+    def __init__(
+        self,
+        cache_file=CACHE_FILE,
+        mode="cache",
+        ttl_seconds=24 * 60 * 60,
+        max_entries=10000,
+    ):
+        if mode not in SEARCH_CACHE_MODES:
+            raise ValueError(f"Unknown search cache mode {mode}")
+        self.mode = mode
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.in_flight = {}
+        self.hits = 0
+        self.misses = 0
+        self.deduplicated = 0
+
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        self.connection = sqlite3.connect(
+            cache_file, timeout=30, check_same_thread=False
+        )
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS searches (
+                    key TEXT PRIMARY KEY,
+                    query TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """)
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS searches_last_access"
+                " ON searches (last_access)"
+            )
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            mode=os.getenv("GAIA_SEARCH_CACHE_MODE", "cache"),
+            ttl_seconds=float(os.getenv("GAIA_SEARCH_CACHE_TTL_HOURS", 24)) * 60 * 60,
+            max_entries=int(os.getenv("GAIA_SEARCH_CACHE_MAX_ENTRIES", 10000)),
+        )
+
+    def get(self, key):
+        now = time.time()
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                "SELECT result, created FROM searches WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            result, created = row
+            if self.mode != "replay" and now - created > self.ttl_seconds:
+                return None
+            self.connection.execute(
+                "UPDATE searches SET last_access = ? WHERE key = ?", (now, key)
+            )
+        return json.loads(result)
+
+    def put(self, key, query, result):
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO searches VALUES (?, ?, ?, ?, ?)",
+                (key, query, json.dumps(result, default=str), now, now),
+            )
+            self.connection.execute(
+                """
+                DELETE FROM searches WHERE key IN (
+                    SELECT key FROM searches ORDER BY last_access DESC
+                    LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+
+    def store_if_successful(self, key, query, result):
+        # Errors are returned as results by the search tool, and are not cached, nor
+        # are empty results, which the search tool raises for rather than returns
+        if isinstance(result, dict) and "error" not in result and result.get("results"):
+            self.put(key, query, result)
+        return result
+
+    def lookup(self, key, query):
+        """A cached result, or a replay mode error, when the search needn't be run"""
+        result = self.get(key)
+        if result is not None:
+            logger.info(f"Search cache hit for {query}")
+            self.hits += 1
+            return result
+        if self.mode == "replay":
+            self.misses += 1
+            return {"error": f"No cached search results for '{query}' in replay mode"}
+        return None
+
+    def search(self, key, query, run_search):
+        result = self.lookup(key, query)
+        if result is not None:
+            return result
+        self.misses += 1
+        return self.store_if_successful(key, query, run_search())
+
+    async def asearch(self, key, query, run_search):
+        result = self.lookup(key, query)
+        if result is not None:
+            return result
+
+        task = self.in_flight.get(key)
+        if task is None:
+            self.misses += 1
+
+            async def search_and_store():
+                return self.store_if_successful(key, query, await run_search())
+
+            task = asyncio.ensure_future(search_and_store())
+            self.in_flight[key] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        else:
+            logger.info(f"Sharing in-flight search for {query}")
+            self.deduplicated += 1
+        # Shielded so one caller being cancelled doesn't cancel the others' search
+        return await asyncio.shield(task)
+
+    def metrics(self):
+        return {
+            "search_cache_hits": self.hits,
+            "search_cache_misses": self.misses,
+            "search_cache_deduplicated": self.deduplicated,
+        }
+
+
+@cache
+def get_search_cache():
+    """The process-wide search cache, created on first use"""
+    return SearchCache.from_env()
+
+
+class CachedTavilySearch(TavilySearch):
+    """TavilySearch with its results cached by the shared SearchCache"""
+
+    def _run(
+        self,
+        query,
+        include_domains=None,
+        exclude_domains=None,
+        search_depth=None,
+        include_images=None,
+        time_range=None,
+        topic=None,
+        run_manager=None,
+    ):
+        search_cache = get_search_cache()
+        run_search = partial(
+            super()._run,
+            query,
+            include_domains,
+            exclude_domains,
+            search_depth,
+            include_images,
+            time_range,
+            topic,
+            run_manager,
+        )
+        if search_cache.mode == "off":
+            return run_search()
+        key = self.make_key(
+            query,
+            include_domains,
+            exclude_domains,
+            search_depth,
+            include_images,
+            time_range,
+            topic,
+        )
+        return search_cache.search(key, query, run_search)
+
+    async def _arun(
+        self,
+        query,
+        include_domains=None,
+        exclude_domains=None,
+        search_depth="basic",
+        include_images=False,
+        time_range=None,
+        topic="general",
+        run_manager=None,
+    ):
+        search_cache = get_search_cache()
+        run_search = partial(
+            super()._arun,
+            query,
+            include_domains,
+            exclude_domains,
+            search_depth,
+            include_images,
+            time_range,
+            topic,
+            run_manager,
+        )
+        if search_cache.mode == "off":
+            return await run_search()
+        key = self.make_key(
+            query,
+            include_domains,
+            exclude_domains,
+            search_depth,
+            include_images,
+            time_range,
+            topic,
+        )
+        return await search_cache.asearch(key, query, run_search)
+
+    def make_key(
+        self,
+        query,
+        include_domains,
+        exclude_domains,
+        search_depth,
+        include_images,
+        time_range,
+        topic,
+    ):
+        return make_key(
+            query,
+            include_domains=include_domains,
+            exclude_domains=exclude_domains,
+            search_depth=search_depth or "basic",
+            include_images=bool(include_images),
+            time_range=time_range,
+            topic=topic or "general",
+            max_results=self.max_results,
+        )
@@ -0,0 +1,133 @@
+import logging
+import os
+
+from langchain_core.messages import ToolMessage
+
+logger = logging.getLogger(__name__)
+
+# What the model is configured with, and what every turn used before
+DEFAULT_THINKING_TOKENS = 8000
+DEFAULT_MAX_TOKENS = 10000
+# The API's smallest thinking budget
+MIN_THINKING_TOKENS = 1024
+# Room for the text and tool calls that follow the thinking
+RESPONSE_TOKENS = 2000
+# A rough output rate, to keep a turn's thinking within the time the question has left
+OUTPUT_TOKENS_PER_SECOND = 50
+
+# Thinking budget for planning, on the first turn and after a failed tool call
+LEVEL_THINKING_TOKENS = {"1": 6000, "2": 8000, "3": 10000}
+# The share of that budget for a turn after each tool's results
+TOOL_THINKING_SHARES = {
+    # An exact result, which the next turn usually just reports
+    "evaluate": 0.0,
+    "tavily_search": 0.5,
+    "search_many": 0.5,
+    "search_document": 0.5,
+    "read_document_range": 0.5,
+}
+POLICIES = ("adaptive", "fixed")
+
+
+def get_last_tool_results(messages):
+    """The tool messages answering the model's last turn"""
+    results = []
+    for message in reversed(messages):
+        if not isinstance(message, ToolMessage):
+            break
+        results.append(message)
+    return results
+
+
+def is_error(message):
+    # ToolNode reports a tool's exception as its result
+    return getattr(message, "status", None) == "error" or str(
+        message.content
+    ).startswith("Error: ")
+
+
+class TurnPolicy:
+    """Chooses the thinking budget and max tokens of each turn of a question.
+
+    Most turns don't need the full budget: a turn after an exact calculation usually
+    just submits it, and one after a search mostly picks out what it found. The first
+    turn plans, and gets a budget by the question's level, as does a turn after a tool
+    failed. Later turns get a share of that by the tools whose results they're
+    reading, and the budget never outlasts the question's remaining output tokens or
+    time. The "fixed" policy keeps the model's own settings on every turn.
+
+    Settings are passed as call kwargs, so the model with its tools bound is shared by
+    every turn rather than bound again. A turn with the model's own settings passes
+    none, so its recordings and prompt cache carry over. Changing the thinking budget
+    invalidates the cached messages (though not the system prompt or tools), which is
+    why there are only a few distinct budgets.
+    """
+
+    def __init__(self, policy="adaptive"):
+        if policy not in POLICIES:
+            raise ValueError(
+                f"Unknown turn policy {policy}, expected one of {POLICIES}"
+            )
+        self.policy = policy
+
+    @classmethod
+    def from_env(cls):
+        return cls(os.getenv("GAIA_TURN_POLICY", "adaptive"))
+
+    def get_thinking_tokens(self, turn, tool_results, level):
+        """The budget for a turn, given (name, is_error) of the tool results it reads"""
+        planning = LEVEL_THINKING_TOKENS.get(str(level), DEFAULT_THINKING_TOKENS)
+        if turn == 0 or not tool_results:
+            return planning
+        if any(failed for _, failed in tool_results):
+            return planning
+        share = max(TOOL_THINKING_SHARES.get(name, 1.0) for name, _ in tool_results)
+        return max(MIN_THINKING_TOKENS, int(planning * share))
+
+    def get_settings(
+        self,
+        turn,
+        tool_results,
+        level,
+        remaining_output_tokens=None,
+        remaining_seconds=None,
+    ):
+        """The thinking budget and max tokens of a turn, as (thinking, max_tokens)"""
+        if self.policy == "fixed":
+            return DEFAULT_THINKING_TOKENS, DEFAULT_MAX_TOKENS
+        thinking = self.get_thinking_tokens(turn, tool_results, level)
+        if remaining_seconds is not None:
+            thinking = min(thinking, int(remaining_seconds * OUTPUT_TOKENS_PER_SECOND))
+        if remaining_output_tokens is not None:
+            thinking = min(thinking, remaining_output_tokens - RESPONSE_TOKENS)
+        thinking = max(MIN_THINKING_TOKENS, thinking)
+        return thinking, thinking + RESPONSE_TOKENS
+
+    def get_final_turn_settings(self):
+        """Settings for the turn that only submits an answer once a budget runs out"""
+        if self.policy == "fixed":
+            return DEFAULT_THINKING_TOKENS, DEFAULT_MAX_TOKENS
+        return MIN_THINKING_TOKENS, MIN_THINKING_TOKENS + RESPONSE_TOKENS
+
+    def get_turn_settings(self, state, budget):
+        return self.get_settings(
+            state.turns,
+            [
+                (message.name, is_error(message))
+                for message in get_last_tool_results(state.messages)
+            ],
+            state.question.get("Level"),
+            remaining_output_tokens=budget.max_output_tokens - state.output_tokens,
+            remaining_seconds=budget.remaining_seconds(state),
+        )
+
+
+def get_call_kwargs(settings):
+    """The model call kwargs for settings, none if they're the model's own"""
+    thinking, max_tokens = settings
+    if (thinking, max_tokens) == (DEFAULT_THINKING_TOKENS, DEFAULT_MAX_TOKENS):
+        return {}
+    return {
+        "max_tokens": max_tokens,
+        "thinking": {"type": "enabled", "budget_tokens": thinking},
+    }
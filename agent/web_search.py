@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import os
+import weakref
+from functools import partial
+
+import httpx
+
+from agent.search_cache import get_search_cache, normalize_query
+
+logger = logging.getLogger(__name__)
+
+TAVILY_SEARCH_URL = "https://api.tavily.com/search"
+MAX_CONCURRENT_SEARCHES = int(os.getenv("GAIA_MAX_CONCURRENT_SEARCHES", 4))
+
+
+class PooledSearchClient:
+    """Calls the Tavily search API over one pooled HTTP client.
+
+    TavilySearch opens a new connection for every search. This keeps connections
+    alive between searches, and across concurrent agents, on the running event loop.
+    At most max_concurrency searches run at once on a loop, whichever agent made them.
+    """
+
+    def __init__(self, max_connections=10, max_concurrency=MAX_CONCURRENT_SEARCHES):
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency
+        # httpx clients and semaphores belong to the event loop they were made on,
+        # and are let go along with it
+        self.clients = weakref.WeakKeyDictionary()
+        self.semaphores = weakref.WeakKeyDictionary()
+
+    def get_client(self):
+        loop = asyncio.get_running_loop()
+        client = self.clients.get(loop)
+        if client is None:
+            client = self.clients[loop] = httpx.AsyncClient(
+                timeout=30,
+                limits=httpx.Limits(max_connections=self.max_connections),
+            )
+        return client
+
+    def get_semaphore(self):
+        loop = asyncio.get_running_loop()
+        semaphore = self.semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self.semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    async def aclose(self):
+        """Close the running loop's client and its connections"""
+        client = self.clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    async def search(self, query, api_key, max_results):
+        response = await self.get_client().post(
+            TAVILY_SEARCH_URL,
+            json={"query": query, "max_results": max_results, "topic": "general"},
+            headers={"Authorization": f"Bearer {api_key}"},
+        )
+        response.raise_for_status()
+        return response.json()
+
+
+search_client = PooledSearchClient()
+
+
+async def search_many(queries, search_tool):
+    """Run several searches concurrently and merge their results, one entry per URL.
+
+    Each search goes through the shared search cache, the same as single searches made
+    with search_tool, so it can be answered from the cache or share an in-flight
+    request with another agent.
+    """
+    search_cache = get_search_cache()
+    semaphore = search_client.get_semaphore()
+    api_key = search_tool.api_wrapper.tavily_api_key.get_secret_value()
+
+    # Queries that only differ in case or spacing are the same search
+    unique_queries = {}
+    for query in queries:
+        unique_queries.setdefault(normalize_query(query), query)
+    unique_queries = list(unique_queries.values())
+
+    async def search(query):
+        async with semaphore:
+            run_search = partial(
+                search_client.search, query, api_key, search_tool.max_results
+            )
+            if search_cache.mode == "off":
+                return await run_search()
+            key = search_tool.make_key(query, None, None, None, None, None, None)
+            return await search_cache.asearch(key, query, run_search)
+
+    responses = await asyncio.gather(
+        *[search(query) for query in unique_queries], return_exceptions=True
+    )
+
+    results_by_url = {}
+    errors = {}
+    for query, response in zip(unique_queries, responses):
+        if isinstance(response, BaseException) or "error" in response:
+            error = (
+                response if isinstance(response, BaseException) else response["error"]
+            )
+            logger.error(f"Search for {query} failed: {error}")
+            errors[query] = str(error)
+            continue
+        for result in response.get("results", []):
+            merged = results_by_url.setdefault(
+                result["url"],
+                {
+                    "title": result.get("title"),
+                    "url": result["url"],
+                    "content": result.get("content"),
+                    "queries": [],
+                },
+            )
+            merged["queries"].append(query)
+
+    merged_results = {"results": list(results_by_url.values())}
+    if errors:
+        merged_results["errors"] = errors
+    return merged_results
@@ -0,0 +1,137 @@
+"""Input tokens per question with attachments inlined against searched.
+
+Each question with an attachment is answered twice, once with the whole document
+inlined in the question ("before") and once with documents over
+GAIA_DOCUMENT_INLINE_MAX_CHARACTERS indexed and read through the search_document and
+read_document_range tools ("after"). The input tokens reported by the model are
+summed over every turn. This calls the real model, so record the run to repeat it
+offline later:
+
+    python -m benchmarks.document_tokens --limit 20 --llm-replay replay-or-record
+
+With --estimate the model isn't called: the size of the first message of each
+question is estimated instead, which every later turn re-sends.
+"""
+
+import argparse
+import asyncio
+import math
+
+from agent.document_store import DOCUMENT_INLINE_MAX_CHARACTERS, Document
+from agent.gaia import GaiaAgent, bind_tools, compile_graph, tools
+from agent.rate_limiter import estimate_tokens
+from agent.replay import REPLAY_MODES, RecordReplayChatModel
+from utils.file_extractors import FileExtractor
+from utils.questions import QuestionProvider
+
+
+class InputTokenCountingLLM:
+    """Sums the input tokens of the calls made to the model it wraps"""
+
+    def __init__(self, llm):
+        self.llm = llm
+        self.input_tokens = 0
+
+    async def ainvoke(self, messages, **kwargs):
+        response = await self.llm.ainvoke(messages, **kwargs)
+        usage = getattr(response, "usage_metadata", None) or {}
+        self.input_tokens += usage.get("input_tokens", 0)
+        return response
+
+
+def make_agent(graph_tools, inline_max_characters, llm_replay):
+    llm = bind_tools(graph_tools)
+    if llm_replay:
+        llm = RecordReplayChatModel(model=llm, mode=llm_replay)
+    counter = InputTokenCountingLLM(llm)
+    agent = GaiaAgent(
+        llm=counter,
+        graph=compile_graph(graph_tools),
+        inline_max_characters=inline_max_characters,
+    )
+    return agent, counter
+
+
+async def run(questions, ground_truths, llm_replay):
+    document_tools = {"search_document", "read_document_range"}
+    variants = {
+        "before": make_agent(
+            [t for t in tools if t.name not in document_tools], math.inf, llm_replay
+        ),
+        "after": make_agent(tools, DOCUMENT_INLINE_MAX_CHARACTERS, llm_replay),
+    }
+    totals = {name: [0, 0] for name in variants}
+    print(f"{'task_id':<38} {'before':>9} {'after':>9}")
+    for question, ground_truth in zip(questions, ground_truths):
+        input_tokens = {}
+        for name, (agent, counter) in variants.items():
+            counter.input_tokens = 0
+            try:
+                answer = await agent.answer_question(question)
+            except Exception as e:
+                print(f"  {question['task_id']} failed: {e}")
+                answer = None
+            input_tokens[name] = counter.input_tokens
+            totals[name][0] += counter.input_tokens
+            totals[name][1] += answer == ground_truth
+        print(
+            f"{question['task_id']:<38}"
+            f" {input_tokens['before']:>9} {input_tokens['after']:>9}"
+        )
+
+    count = len(questions)
+    for name, (input_tokens, correct) in totals.items():
+        print(
+            f"{name}: {input_tokens / count:.0f} input tokens per question,"
+            f" {correct}/{count} correct"
+        )
+
+
+def estimate(questions):
+    """Estimated tokens of each question's first message, without calling the model"""
+    totals = {"before": 0, "after": 0}
+    print(f"{'file_name':<50} {'before':>9} {'after':>9}")
+    for question in questions:
+        try:
+            text = FileExtractor(question["file_name"])()
+        except Exception as e:
+            print(f"  {question['file_name']} skipped: {e}")
+            continue
+        tokens = {"before": estimate_tokens([{"content": question["question"] + text}])}
+        if len(text) > DOCUMENT_INLINE_MAX_CHARACTERS:
+            summary = Document(question["file_name"], text).summary()
+            tokens["after"] = estimate_tokens(
+                [{"content": question["question"] + summary}]
+            )
+        else:
+            tokens["after"] = tokens["before"]
+        for name in totals:
+            totals[name] += tokens[name]
+        print(f"{question['file_name']:<50} {tokens['before']:>9} {tokens['after']:>9}")
+    print(f"total per turn: {totals['before']} tokens before, {totals['after']} after")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--llm-replay", choices=REPLAY_MODES)
+    parser.add_argument("--estimate", action="store_true")
+    args = parser.parse_args()
+
+    questions, ground_truths = QuestionProvider().get_questions()
+    with_files = [
+        (question, ground_truth)
+        for question, ground_truth in zip(questions, ground_truths)
+        if question["file_name"]
+    ][: args.limit]
+    questions = [question for question, _ in with_files]
+    ground_truths = [ground_truth for _, ground_truth in with_files]
+
+    if args.estimate:
+        estimate(questions)
+    else:
+        asyncio.run(run(questions, ground_truths, args.llm_replay))
+
+
+if __name__ == "__main__":
+    main()
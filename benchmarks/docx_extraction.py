@@ -0,0 +1,220 @@
+"""Streaming docx extraction against the python-docx walk it replaced.
+
+Generated documents with headings, custom and built-in styles, breaks, hyperlinks,
+nested tables, rows starting late, and tables with merged cells, plus any
+docx attachments already downloaded, are extracted both ways. Any difference in the
+text fails the run, as the extraction cache assumes the output didn't change. Then
+both are timed on generated documents of increasing size:
+
+    python -m benchmarks.docx_extraction
+    python -m benchmarks.docx_extraction --sizes 1000 10000 --repeat 5
+"""
+
+import argparse
+import difflib
+import os
+import sys
+import tempfile
+import time
+
+from utils.docx_text import docx_to_text
+
+BENCHMARK_DIRECTORY = tempfile.mkdtemp(prefix="gaia-docx-")
+
+
+def python_docx_to_text(file_path):
+    """The python-docx extraction, as FileExtractor.docx_to_text did it before"""
+    from docx import Document
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+
+    doc = Document(file_path)
+    lines = []
+    for child in doc.element.body:
+        if child.tag.endswith("p"):
+            block = Paragraph(child, doc)
+            style = block.style.name
+            text = "".join(run.text for run in block.runs).strip()
+            if not text:
+                continue
+            if style.startswith("Heading"):
+                lines.append(f"# {text}")
+            else:
+                lines.append(text)
+        elif child.tag.endswith("tbl"):
+            for row in Table(child, doc).rows:
+                cells = [cell.text.strip().replace("\n", " ") for cell in row.cells]
+                lines.append("| " + " | ".join(cells) + " |")
+    return "\n".join(lines)
+
+
+def add_hyperlink(paragraph, text):
+    from docx.oxml import OxmlElement
+
+    hyperlink = OxmlElement("w:hyperlink")
+    run = OxmlElement("w:r")
+    text_element = OxmlElement("w:t")
+    text_element.text = text
+    run.append(text_element)
+    hyperlink.append(run)
+    paragraph._p.append(hyperlink)
+
+
+def add_merged_table(doc, rows, columns):
+    """A table with cells merged across columns, down rows and both at once"""
+    table = doc.add_table(rows=rows, cols=columns)
+    for i, row in enumerate(table.rows):
+        for j, cell in enumerate(row.cells):
+            cell.text = f"r{i}c{j}"
+    for i in range(0, rows - 2, 3):
+        table.cell(i, 0).merge(table.cell(i + 2, 0))
+        table.cell(i, 1).merge(table.cell(i, 2))
+        if columns > 4:
+            table.cell(i + 1, 3).merge(table.cell(i + 2, 4))
+    return table
+
+
+def start_row_late(row):
+    """Drop a row's first cell, leaving its grid column empty"""
+    from docx.oxml import OxmlElement
+    from docx.oxml.ns import qn
+
+    row._tr.remove(row._tr.tc_lst[0])
+    grid_before = OxmlElement("w:gridBefore")
+    grid_before.set(qn("w:val"), "1")
+    row._tr.get_or_add_trPr().append(grid_before)
+
+
+def make_features_document(path):
+    from docx import Document
+    from docx.enum.style import WD_STYLE_TYPE
+    from docx.enum.text import WD_BREAK
+
+    doc = Document()
+    doc.add_heading("Title style, which isn't a heading", 0)
+    doc.add_heading("A heading", 1)
+    doc.add_heading("A deeper heading", 3)
+    doc.styles.add_style("Heading Custom", WD_STYLE_TYPE.PARAGRAPH)
+    doc.add_paragraph("A custom heading style", style="Heading Custom")
+    doc.styles.add_style("Notes", WD_STYLE_TYPE.PARAGRAPH)
+    doc.add_paragraph("A custom style", style="Notes")
+    doc.add_paragraph("A list item", style="List Bullet")
+    doc.add_paragraph("")
+    doc.add_paragraph("   ")
+
+    paragraph = doc.add_paragraph("Runs ")
+    paragraph.add_run("in bold").bold = True
+    paragraph.add_run("\twith a tab, ")
+    paragraph.add_run("a line break").add_break()
+    paragraph.add_run("and a page break")
+    paragraph.runs[-1].add_break(WD_BREAK.PAGE)
+    paragraph.add_run("after it")
+    add_hyperlink(paragraph, " (link text is skipped outside tables)")
+    add_hyperlink(doc.add_paragraph(), "A paragraph that's only a link")
+
+    table = add_merged_table(doc, 7, 6)
+    table.cell(0, 5).add_paragraph("a second paragraph")
+    add_hyperlink(table.cell(1, 5).paragraphs[0], " and a link")
+    table.cell(2, 5).add_table(rows=2, cols=2).cell(0, 0).text = "nested"
+    table.cell(3, 5).text = "  padded\nover lines  "
+    doc.add_paragraph("Between tables")
+    table = doc.add_table(rows=3, cols=3)
+    table.cell(1, 1).text = "sparse"
+    table.cell(1, 2).merge(table.cell(2, 2)).text = "merged down"
+    start_row_late(table.rows[2])
+    doc.add_heading("After the tables", 2)
+    doc.save(path)
+
+
+def make_large_document(path, paragraphs):
+    """paragraphs paragraphs under headings, a merged table for every 100 and a
+    final table with a row for every 10"""
+    from docx import Document
+
+    doc = Document()
+    for i in range(paragraphs):
+        if i % 50 == 0:
+            doc.add_heading(f"Section {i // 50}", 1 + i // 50 % 3)
+        paragraph = doc.add_paragraph(f"Paragraph {i} says ")
+        paragraph.add_run("something in a second run, ").italic = True
+        paragraph.add_run("and a third.")
+        if i % 100 == 99:
+            add_merged_table(doc, 30, 6)
+    add_merged_table(doc, paragraphs // 10, 6)
+    doc.save(path)
+
+
+def compare(path):
+    expected = python_docx_to_text(path)
+    actual = docx_to_text(path)
+    if actual == expected:
+        return True
+    print(f"{path}: output differs from python-docx")
+    sys.stdout.writelines(
+        difflib.unified_diff(
+            expected.splitlines(keepends=True),
+            actual.splitlines(keepends=True),
+            "python-docx",
+            "docx_text",
+        )
+    )
+    return False
+
+
+def get_attachments():
+    try:
+        from utils.dataset_files import get_dataset_file_resolver
+
+        resolver = get_dataset_file_resolver()
+        return [
+            resolver.resolve(name)
+            for name in resolver.list_files()
+            if name.endswith(".docx")
+        ]
+    except Exception as e:
+        print(f"Not comparing dataset attachments: {e}")
+        return []
+
+
+def best_time(extract, path, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        extract(path)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[500, 2000, 8000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    features = os.path.join(BENCHMARK_DIRECTORY, "features.docx")
+    make_features_document(features)
+    paths = [features, *get_attachments()]
+    matched = sum(compare(path) for path in paths)
+    print(f"{matched}/{len(paths)} documents extracted identically")
+    if matched != len(paths):
+        sys.exit(1)
+
+    print(
+        f"{'paragraphs':>10} {'MiB':>6} {'python-docx s':>14} {'streamed s':>11}"
+        f" {'speedup':>8}"
+    )
+    for size in args.sizes:
+        path = os.path.join(BENCHMARK_DIRECTORY, f"large-{size}.docx")
+        make_large_document(path, size)
+        if not compare(path):
+            sys.exit(1)
+        reference = best_time(python_docx_to_text, path, args.repeat)
+        streamed = best_time(docx_to_text, path, args.repeat)
+        print(
+            f"{size:>10} {os.path.getsize(path) / 2**20:>6.2f} {reference:>14.3f}"
+            f" {streamed:>11.3f} {reference / streamed:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
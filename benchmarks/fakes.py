@@ -0,0 +1,170 @@
+"""Stand-ins for the model and web search, so the harness can be run offline.
+
+ScriptedChatModel streams chunks shaped like ChatAnthropic's (thinking, text, then a
+tool call) with configurable latency, following a fixed script of tool calls.
+make_fake_search returns a tool named like the Tavily one that sleeps instead of
+calling the API.
+"""
+
+import asyncio
+import json
+import time
+from typing import List
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.tools import tool
+
+# The tool calls made on each turn of a question, in order. search_document is only
+# called for questions with a long attachment, and skipped otherwise.
+DEFAULT_SCRIPT = ("tavily_search", "search_document", "evaluate", "submit_final_answer")
+
+
+def tool_arguments(name, turn):
+    match name:
+        case "tavily_search":
+            return {"query": f"benchmark query {turn}"}
+        case "search_many":
+            return {"queries": [f"benchmark query {turn}", f"another query {turn}"]}
+        case "evaluate":
+            return {"expressions": ["x = 6 * 7", "sum(range(100)) + x"]}
+        case "search_document":
+            return {"query": "total widgets"}
+        case "read_document_range":
+            return {"start_line": 1, "end_line": 50}
+        case "submit_final_answer":
+            return {"answer": "42"}
+    raise ValueError(f"No scripted arguments for {name}")
+
+
+class ScriptedChatModel(BaseChatModel):
+    """A chat model that plays a script of tool calls, one per turn.
+
+    Each response waits first_token_latency, then streams thinking_chunks and
+    text_chunks chunks chunk_delay apart, then the tool call. Usage metadata reports
+    the input as ~4 characters per token so token budgets behave as with the real
+    model.
+    """
+
+    script: List[str] = list(DEFAULT_SCRIPT)
+    first_token_latency: float = 0.0
+    chunk_delay: float = 0.0
+    thinking_chunks: int = 20
+    text_chunks: int = 10
+
+    @property
+    def _llm_type(self):
+        return "scripted"
+
+    def next_tool(self, messages):
+        turn = sum(1 for message in messages if isinstance(message, AIMessage))
+        has_document = "search_document tool" in str(messages[1].content)
+        steps = [
+            name for name in self.script if name != "search_document" or has_document
+        ]
+        return turn, steps[min(turn, len(steps) - 1)]
+
+    def get_chunks(self, messages):
+        """The chunks of a response, each with the chunk delay to wait before it"""
+        turn, name = self.next_tool(messages)
+        input_characters = sum(len(str(message.content)) for message in messages)
+
+        for i in range(self.thinking_chunks):
+            yield self.chunk_delay if i else 0.0, ChatGenerationChunk(
+                message=AIMessageChunk(
+                    content=[{"type": "thinking", "thinking": "hmm ", "index": 0}]
+                )
+            )
+        for _ in range(self.text_chunks):
+            yield self.chunk_delay, ChatGenerationChunk(
+                message=AIMessageChunk(
+                    content=[{"type": "text", "text": "Let me see. ", "index": 1}]
+                )
+            )
+
+        tool_call_id = f"toolu_{turn}"
+        yield 0.0, ChatGenerationChunk(
+            message=AIMessageChunk(
+                content=[
+                    {
+                        "type": "tool_use",
+                        "name": name,
+                        "id": tool_call_id,
+                        "input": {},
+                        "index": 2,
+                    }
+                ],
+                tool_call_chunks=[
+                    {
+                        "name": name,
+                        "args": json.dumps(tool_arguments(name, turn)),
+                        "id": tool_call_id,
+                        "index": 2,
+                    }
+                ],
+            )
+        )
+        output_tokens = 4 * self.thinking_chunks + 12 * self.text_chunks
+        yield 0.0, ChatGenerationChunk(
+            message=AIMessageChunk(
+                content="",
+                usage_metadata={
+                    "input_tokens": input_characters // 4,
+                    "output_tokens": output_tokens,
+                    "total_tokens": input_characters // 4 + output_tokens,
+                },
+                response_metadata={"stop_reason": "tool_use"},
+            )
+        )
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.first_token_latency:
+            await asyncio.sleep(self.first_token_latency)
+        for delay, chunk in self.get_chunks(messages):
+            if delay:
+                await asyncio.sleep(delay)
+            yield chunk
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.first_token_latency:
+            time.sleep(self.first_token_latency)
+        for delay, chunk in self.get_chunks(messages):
+            if delay:
+                time.sleep(delay)
+            yield chunk
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        message = None
+        async for chunk in self._astream(messages, stop, run_manager, **kwargs):
+            message = chunk.message if message is None else message + chunk.message
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        message = None
+        for chunk in self._stream(messages, stop, run_manager, **kwargs):
+            message = chunk.message if message is None else message + chunk.message
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def make_fake_search(latency=0.0, results=2, result_characters=2000):
+    """A tavily_search tool that returns made up results after latency seconds"""
+
+    @tool("tavily_search")
+    async def fake_search(query: str):
+        """Searches the web for the query."""
+        if latency:
+            await asyncio.sleep(latency)
+        return {
+            "query": query,
+            "results": [
+                {
+                    "title": f"Result {i} for {query}",
+                    "url": f"https://example.com/{i}",
+                    "content": "x" * result_characters,
+                }
+                for i in range(results)
+            ],
+        }
+
+    return fake_search
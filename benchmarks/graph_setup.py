@@ -0,0 +1,39 @@
+"""Per-question setup overhead of the agent graph.
+
+Every question used to build a new StateGraph and ToolNode and compile them. The
+graph is now compiled once at import, so setting up a question only constructs a
+GaiaAgent. This times both:
+
+    python -m benchmarks.graph_setup
+"""
+
+import argparse
+import os
+import timeit
+
+# The clients are constructed at import but never called here
+os.environ.setdefault("ANTHROPIC_API_KEY", "benchmark")
+os.environ.setdefault("TAVILY_API_KEY", "benchmark")
+
+from agent.gaia import GaiaAgent, compile_graph  # noqa: E402
+
+
+def time_per_call(func, number):
+    return timeit.timeit(func, number=number) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    before = time_per_call(compile_graph, args.number)
+    after = time_per_call(GaiaAgent, args.number)
+
+    print(f"compile graph per question (before): {before * 1000:.3f} ms")
+    print(f"shared compiled graph (after):       {after * 1000:.3f} ms")
+    print(f"speedup:                             {before / after:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""Overhead, throughput and memory of the agent harness, run offline.
+
+Questions are answered by the real GaiaAgent graph, streamed through
+MessageChunkPrinter, logged with AnswerFileWriter and, for questions with an
+attachment, extracted with FileExtractor and searched with the document tools. The
+model and web search are the stand-ins in benchmarks/fakes.py, so no network or API
+keys are needed. Three measurements are made:
+
+* overhead: time per turn with a model and search that respond instantly, which is
+  all harness
+* throughput: questions per second at each concurrency level, with latency added to
+  the model and search
+* memory: traced Python memory after each batch of a long run, to catch growth
+
+Results are written as JSON, named after the commit, to compare commits:
+
+    python -m benchmarks.harness
+    python -m benchmarks.harness --concurrency 1 8 32 --questions 64 --output out.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCHMARK_DIRECTORY = tempfile.mkdtemp(prefix="gaia-harness-")
+
+# Set before the agent is imported: the clients are constructed at import but never
+# called, attachments are never downloaded and nothing is cached between runs
+os.environ.setdefault("ANTHROPIC_API_KEY", "benchmark")
+os.environ.setdefault("TAVILY_API_KEY", "benchmark")
+os.environ["GAIA_DATASET_OFFLINE"] = "1"
+os.environ["GAIA_DOWNLOAD_DIRECTORY"] = os.path.join(BENCHMARK_DIRECTORY, "downloads")
+os.environ["GAIA_EXTRACTION_CACHE"] = os.path.join(
+    BENCHMARK_DIRECTORY, "extractions.sqlite3"
+)
+
+from agent.gaia import (  # noqa: E402
+    GaiaAgent,
+    compile_graph,
+    evaluate,
+    read_document_range,
+    search_document,
+    submit_final_answer,
+)
+from benchmarks.fakes import ScriptedChatModel, make_fake_search  # noqa: E402
+from utils.dataset_files import get_dataset_file_resolver  # noqa: E402
+from utils.questions import AnswerFileWriter  # noqa: E402
+from utils.stream_handlers import MessageChunkPrinter  # noqa: E402
+
+RESULTS_DIRECTORY = os.path.join(os.path.dirname(__file__), "results")
+ATTACHMENT_NAME = "benchmark_attachment.py"
+
+
+def make_attachment(lines):
+    """A long attachment, registered with the dataset resolver as if downloaded"""
+    path = os.path.join(BENCHMARK_DIRECTORY, ATTACHMENT_NAME)
+    with open(path, "w") as f:
+        for i in range(lines):
+            f.write(f"widgets_{i} = {i * 7 % 1000}  # total widgets in crate {i}\n")
+    get_dataset_file_resolver().index[ATTACHMENT_NAME] = path
+
+
+def make_questions(count, attachment_every):
+    return [
+        {
+            "task_id": f"benchmark-{i}",
+            "question": f"Benchmark question {i}: how many widgets are there?",
+            "file_name": (
+                ATTACHMENT_NAME
+                if attachment_every and i % attachment_every == 0
+                else ""
+            ),
+            "Level": "1",
+        }
+        for i in range(count)
+    ]
+
+
+def make_agent(llm_latency=0.0, chunk_delay=0.0, search_latency=0.0):
+    graph_tools = [
+        evaluate,
+        make_fake_search(latency=search_latency),
+        search_document,
+        read_document_range,
+        submit_final_answer,
+    ]
+    llm = ScriptedChatModel(first_token_latency=llm_latency, chunk_delay=chunk_delay)
+    return GaiaAgent(
+        handle_message_chunk=MessageChunkPrinter(),
+        llm=llm,
+        graph=compile_graph(graph_tools),
+    )
+
+
+async def answer_all(agent, questions, concurrency, submit_answer):
+    """Answer questions like main.py does, returning the number of turns taken"""
+    semaphore = asyncio.Semaphore(concurrency)
+    turns = 0
+
+    async def attempt(question):
+        nonlocal turns
+        async with semaphore:
+            record = await agent.get_answer_record(question)
+            submit_answer({**record, "question": question["question"]})
+            # Every scripted turn makes one tool call
+            turns += len(
+                [
+                    name
+                    for name in agent.llm.script
+                    if name != "search_document" or question["file_name"]
+                ]
+            )
+
+    await asyncio.gather(*[attempt(question) for question in questions])
+    return turns
+
+
+def run(agent, questions, concurrency, answers_file):
+    # MessageChunkPrinter prints every chunk, which is part of the cost measured
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        submit_answer = AnswerFileWriter(answers_file)
+        start = time.perf_counter()
+        turns = asyncio.run(answer_all(agent, questions, concurrency, submit_answer))
+        return time.perf_counter() - start, turns
+
+
+def measure_overhead(args):
+    agent = make_agent()
+    questions = make_questions(args.questions, args.attachment_every)
+    answers_file = os.path.join(BENCHMARK_DIRECTORY, "overhead.jsonl")
+    # The first pass extracts the attachment and warms up imports
+    run(agent, questions[:2], 1, answers_file)
+    seconds, turns = run(agent, questions, 1, answers_file)
+    return {
+        "questions": len(questions),
+        "turns": turns,
+        "seconds": seconds,
+        "ms_per_turn": seconds / turns * 1000,
+        "ms_per_question": seconds / len(questions) * 1000,
+    }
+
+
+def measure_throughput(args):
+    agent = make_agent(args.llm_latency, args.chunk_delay, args.search_latency)
+    questions = make_questions(args.questions, args.attachment_every)
+    answers_file = os.path.join(BENCHMARK_DIRECTORY, "throughput.jsonl")
+    results = []
+    for concurrency in args.concurrency:
+        seconds, turns = run(agent, questions, concurrency, answers_file)
+        results.append(
+            {
+                "concurrency": concurrency,
+                "seconds": seconds,
+                "questions_per_second": len(questions) / seconds,
+                "turns_per_second": turns / seconds,
+            }
+        )
+    return results
+
+
+def measure_memory(args):
+    agent = make_agent()
+    questions = make_questions(args.memory_batch, args.attachment_every)
+    answers_file = os.path.join(BENCHMARK_DIRECTORY, "memory.jsonl")
+    run(agent, questions, args.memory_concurrency, answers_file)
+
+    tracemalloc.start()
+    batches = []
+    try:
+        for batch in range(args.memory_batches):
+            run(agent, questions, args.memory_concurrency, answers_file)
+            gc.collect()
+            current, peak = tracemalloc.get_traced_memory()
+            batches.append(
+                {"batch": batch, "current_bytes": current, "peak_bytes": peak}
+            )
+    finally:
+        tracemalloc.stop()
+    growth = batches[-1]["current_bytes"] - batches[0]["current_bytes"]
+    return {
+        "questions_per_batch": len(questions),
+        "batches": batches,
+        "growth_bytes": growth,
+        "growth_bytes_per_question": growth
+        / (len(questions) * max(len(batches) - 1, 1)),
+    }
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], text=True
+        ).strip()
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--questions", type=int, default=32)
+    parser.add_argument("--attachment-every", type=int, default=4)
+    parser.add_argument("--attachment-lines", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--chunk-delay", type=float, default=0.002)
+    parser.add_argument("--search-latency", type=float, default=0.1)
+    parser.add_argument("--memory-batch", type=int, default=50)
+    parser.add_argument("--memory-batches", type=int, default=5)
+    parser.add_argument("--memory-concurrency", type=int, default=8)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    make_attachment(args.attachment_lines)
+    commit = get_commit()
+    results = {
+        "commit": commit,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "parameters": vars(args),
+    }
+
+    results["overhead"] = measure_overhead(args)
+    overhead = results["overhead"]
+    print(
+        f"overhead: {overhead['ms_per_turn']:.2f} ms per turn,"
+        f" {overhead['ms_per_question']:.2f} ms per question"
+    )
+
+    results["throughput"] = measure_throughput(args)
+    for result in results["throughput"]:
+        print(
+            f"concurrency {result['concurrency']:>3}:"
+            f" {result['questions_per_second']:.2f} questions/s"
+        )
+
+    results["memory"] = measure_memory(args)
+    memory = results["memory"]
+    print(
+        f"memory: {memory['growth_bytes'] / 2**20:.2f} MiB growth over"
+        f" {len(memory['batches']) - 1} batches,"
+        f" {memory['growth_bytes_per_question']:.0f} bytes per question"
+    )
+
+    output = args.output or os.path.join(RESULTS_DIRECTORY, f"harness-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
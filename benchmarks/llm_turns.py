@@ -0,0 +1,98 @@
+"""LLM turns per question with the one-operation math tools against evaluate.
+
+Each question is answered twice, once with the add/subtract/multiply/divide/sum_array
+tools the agent used to have ("before") and once with the evaluate tool ("after"),
+each with the system prompt written for its tools, counting the LLM turns taken. This
+calls the real model, so record the run to repeat it offline later:
+
+    python -m benchmarks.llm_turns --limit 20 --llm-replay replay-or-record
+"""
+
+import argparse
+import asyncio
+
+from agent.gaia import (
+    LEGACY_SYSTEM_PROMPT,
+    SYSTEM_PROMPT,
+    GaiaAgent,
+    bind_tools,
+    compile_graph,
+    legacy_tools,
+    tools,
+)
+from agent.replay import REPLAY_MODES, RecordReplayChatModel
+from utils.questions import QuestionProvider
+
+
+class TurnCountingLLM:
+    """Counts the calls made to the model it wraps"""
+
+    def __init__(self, llm):
+        self.llm = llm
+        self.turns = 0
+
+    async def ainvoke(self, messages, **kwargs):
+        self.turns += 1
+        return await self.llm.ainvoke(messages, **kwargs)
+
+
+def make_agent(graph_tools, system_prompt, llm_replay):
+    llm = bind_tools(graph_tools)
+    if llm_replay:
+        llm = RecordReplayChatModel(model=llm, mode=llm_replay)
+    counter = TurnCountingLLM(llm)
+    agent = GaiaAgent(
+        llm=counter, graph=compile_graph(graph_tools), system_prompt=system_prompt
+    )
+    return agent, counter
+
+
+async def count_turns(agent, counter, question, ground_truth):
+    """Turns taken to answer a question, and whether the answer was correct"""
+    counter.turns = 0
+    try:
+        answer = await agent.answer_question(question)
+    except Exception as e:
+        print(f"  {question['task_id']} failed: {e}")
+        answer = None
+    return counter.turns, answer == ground_truth
+
+
+async def run(questions, ground_truths, llm_replay):
+    variants = {
+        "before": make_agent(legacy_tools, LEGACY_SYSTEM_PROMPT, llm_replay),
+        "after": make_agent(tools, SYSTEM_PROMPT, llm_replay),
+    }
+    totals = {name: [0, 0] for name in variants}
+    print(f"{'task_id':<38} {'before':>7} {'after':>7}")
+    for question, ground_truth in zip(questions, ground_truths):
+        turns = {}
+        for name, (agent, counter) in variants.items():
+            turns[name], is_correct = await count_turns(
+                agent, counter, question, ground_truth
+            )
+            totals[name][0] += turns[name]
+            totals[name][1] += is_correct
+        print(f"{question['task_id']:<38} {turns['before']:>7} {turns['after']:>7}")
+
+    count = len(questions)
+    for name, (turns, correct) in totals.items():
+        print(
+            f"{name}: {turns / count:.2f} turns per question, {correct}/{count} correct"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--llm-replay", choices=REPLAY_MODES)
+    args = parser.parse_args()
+
+    questions, ground_truths = QuestionProvider().get_questions()
+    asyncio.run(
+        run(questions[: args.limit], ground_truths[: args.limit], args.llm_replay)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Import time of the agent, measured with python -X importtime.
+
+Runs the import in a fresh interpreter, reports its total and the slowest of the
+module's own imports, and checks that no heavy optional dependency was pulled in:
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --module main --fail-on-heavy
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+# Only needed once a file, or a run, actually uses them
+HEAVY_MODULES = ["torch", "transformers", "docx", "openpyxl", "mlflow"]
+
+
+def parse_importtime(stderr):
+    """(module, cumulative microseconds, depth) of each import after startup, in order"""
+    timings = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        # Nested imports are indented two spaces under the module that imported them,
+        # after a single space
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        timings.append((name.strip(), int(cumulative), depth))
+        # What the interpreter imports on startup ends with site
+        if name.strip() == "site" and depth == 0:
+            timings.clear()
+    return timings
+
+
+def measure(module):
+    env = {
+        **os.environ,
+        "ANTHROPIC_API_KEY": os.getenv("ANTHROPIC_API_KEY", "benchmark"),
+        "TAVILY_API_KEY": os.getenv("TAVILY_API_KEY", "benchmark"),
+    }
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{completed.stderr}")
+    return parse_importtime(completed.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="agent.gaia")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument(
+        "--fail-on-heavy",
+        action="store_true",
+        help="Exit with an error if a heavy dependency is imported at startup",
+    )
+    args = parser.parse_args()
+
+    timings = measure(args.module)
+    # The module and any of its packages not yet imported, then what they import
+    total = sum(cumulative for _, cumulative, depth in timings if depth == 0)
+    print(f"import {args.module}: {total / 1000:.1f} ms")
+    imports = [(name, cumulative) for name, cumulative, depth in timings if depth == 1]
+    slowest = sorted(imports, key=lambda item: item[1], reverse=True)
+    for name, cumulative in slowest[: args.top]:
+        print(f"  {cumulative / 1000:9.1f} ms  {name}")
+
+    imported = {name for name, _, _ in timings}
+    heavy = [module for module in HEAVY_MODULES if module in imported]
+    if heavy:
+        print(f"heavy modules imported at startup: {', '.join(heavy)}")
+        if args.fail_on_heavy:
+            sys.exit(1)
+    else:
+        print("no heavy modules imported at startup")
+
+
+if __name__ == "__main__":
+    main()
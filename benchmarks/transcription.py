@@ -0,0 +1,106 @@
+"""CPU transcription mode against the default pipeline on the dataset's mp3 files.
+
+For every mp3 attachment this reports the real-time factor (transcription time over
+audio duration) of both modes, and the word-level agreement of the CPU mode's
+transcript with the default one (1 - word error rate):
+
+    python -m benchmarks.transcription --threads 4 --batch-size 8
+"""
+
+import argparse
+import re
+import time
+
+from utils.dataset_files import get_dataset_file_resolver
+from utils.transcription import (
+    SAMPLING_RATE,
+    TranscriptionConfig,
+    get_cpu_whisper,
+    get_whisper,
+    load_audio,
+    transcribe,
+)
+
+
+def normalize_words(text):
+    return re.sub(r"[^\w\s']", " ", text.lower()).split()
+
+
+def word_error_rate(reference, hypothesis):
+    reference, hypothesis = normalize_words(reference), normalize_words(hypothesis)
+    if not reference:
+        return float(bool(hypothesis))
+    # Word-level edit distance, keeping a single row of the table
+    previous = list(range(len(hypothesis) + 1))
+    for i, reference_word in enumerate(reference, start=1):
+        current = [i]
+        for j, hypothesis_word in enumerate(hypothesis, start=1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (reference_word != hypothesis_word),
+                )
+            )
+        previous = current
+    return previous[-1] / len(reference)
+
+
+def timed_transcription(file_path, config):
+    start = time.perf_counter()
+    text = transcribe(file_path, config)
+    return text, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--no-quantize", action="store_true")
+    parser.add_argument("--no-trim", action="store_true")
+    args = parser.parse_args()
+
+    default = TranscriptionConfig(mode="default")
+    cpu = TranscriptionConfig(
+        mode="cpu",
+        batch_size=args.batch_size,
+        quantize=not args.no_quantize,
+        threads=args.threads,
+        trim=not args.no_trim,
+    )
+
+    # Load both models up front so loading isn't counted against the first file
+    get_whisper()
+    get_cpu_whisper(cpu.quantize)
+
+    resolver = get_dataset_file_resolver()
+    file_names = [name for name in resolver.list_files() if name.endswith(".mp3")]
+    total_audio = total_default = total_cpu = total_agreement = 0.0
+    print(
+        f"{'file':<44} {'audio s':>8} {'RTF default':>12} {'RTF cpu':>8} {'agree':>6}"
+    )
+    for file_name in file_names:
+        file_path = resolver.resolve(file_name)
+        duration = len(load_audio(file_path)) / SAMPLING_RATE
+        default_text, default_seconds = timed_transcription(file_path, default)
+        cpu_text, cpu_seconds = timed_transcription(file_path, cpu)
+        agreement = 1 - min(word_error_rate(default_text, cpu_text), 1.0)
+
+        total_audio += duration
+        total_default += default_seconds
+        total_cpu += cpu_seconds
+        total_agreement += agreement
+        print(
+            f"{file_name:<44} {duration:8.1f} {default_seconds / duration:12.3f}"
+            f" {cpu_seconds / duration:8.3f} {agreement:6.1%}"
+        )
+
+    if file_names:
+        print(
+            f"{'total':<44} {total_audio:8.1f} {total_default / total_audio:12.3f}"
+            f" {total_cpu / total_audio:8.3f} {total_agreement / len(file_names):6.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+"""Output tokens and latency the adaptive turn policy saves, against accuracy.
+
+By default this is worked out offline from recorded transcripts (the recordings
+--llm-replay makes, taken with GAIA_TURN_POLICY=fixed), with no model calls. For every
+recorded turn the adaptive policy's budget is worked out from the same signals it
+sees when running. A turn whose recorded thinking or output fits within that budget
+is assumed unchanged. A turn that went over is "at risk": its output is cut down to
+the budget to count what's saved, and its question's answer might have changed. The
+questions are matched to answer logs by their text to find their level and whether
+they were answered correctly, giving a range for the accuracy with the policy:
+
+    python -m benchmarks.turn_policy
+    python -m benchmarks.turn_policy --answers answers/some-run.jsonl
+
+Only what the model was made to stop doing is counted as saved, though a smaller
+budget usually makes it think less as well. To measure that, and the accuracy, for
+real, --live answers questions with both policies:
+
+    python -m benchmarks.turn_policy --live --limit 20 --llm-replay replay-or-record
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import os
+import time
+
+from agent.gaia import FINAL_TURN_PROMPT, GaiaAgent
+from agent.replay import RECORDINGS_DIRECTORY, REPLAY_MODES, RecordReplayChatModel
+from agent.turn_policy import OUTPUT_TOKENS_PER_SECOND, TurnPolicy
+
+ANSWERS_DIRECTORY = os.path.join(os.path.dirname(__file__), "..", "answers")
+
+
+def load_answers(paths):
+    """Answer records by question text, the latest of each"""
+    answers = {}
+    for path in paths:
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    answer = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if answer.get("question"):
+                    answers[answer["question"]] = answer
+    return answers
+
+
+def message_text(message):
+    """A recorded message's text, which is a list of blocks when it's cached"""
+    content = message["content"]
+    if isinstance(content, str):
+        return content
+    parts = []
+    for block in content:
+        if isinstance(block, str):
+            parts.append(block)
+        elif block.get("type") == "text":
+            parts.append(block["text"])
+        elif block.get("type") == "tool_result":
+            parts.append(str(block["content"]))
+    return "".join(parts)
+
+
+def find_answer(answers, messages):
+    """The answer record of the question a transcript is answering"""
+    question = next((m for m in messages if m["type"] == "human"), None)
+    if question is None:
+        return None
+    content = message_text(question)
+    for text, answer in answers.items():
+        if content.startswith(text):
+            return answer
+    return None
+
+
+def get_signals(messages):
+    """The turn number and last tool results of a transcript, as the policy sees them"""
+    turn = sum(1 for message in messages if message["type"] == "ai")
+    tool_results = []
+    for message in reversed(messages):
+        if message["type"] != "tool":
+            break
+        tool_results.append(
+            (message["name"], message_text(message).startswith("Error: "))
+        )
+    return turn, tool_results
+
+
+def is_final_turn(messages):
+    last = messages[-1]
+    prompt = FINAL_TURN_PROMPT.split("{reason}")[0]
+    return last["type"] == "human" and message_text(last).startswith(prompt)
+
+
+def get_output(response):
+    """Output tokens of a recorded response, and the share of them spent thinking"""
+    data = response["data"]
+    output_tokens = (data.get("usage_metadata") or {}).get("output_tokens", 0)
+    thinking = other = 0
+    content = data["content"]
+    for block in content if isinstance(content, list) else [content]:
+        if isinstance(block, str):
+            other += len(block)
+        elif block.get("type") == "thinking":
+            thinking += len(block.get("thinking", ""))
+        elif block.get("type") == "text":
+            other += len(block.get("text", ""))
+    for tool_call in data.get("tool_calls") or []:
+        other += len(json.dumps(tool_call["args"]))
+    share = thinking / (thinking + other) if thinking + other else 0.0
+    return output_tokens, share
+
+
+def evaluate_turn(policy, recording, answer):
+    messages = recording["messages"]
+    level = answer.get("level") if answer else None
+    if is_final_turn(messages):
+        settings = policy.get_final_turn_settings()
+    else:
+        turn, tool_results = get_signals(messages)
+        settings = policy.get_settings(turn, tool_results, level)
+    thinking_budget, max_tokens = settings
+
+    output_tokens, thinking_share = get_output(recording["response"])
+    thinking_tokens = round(output_tokens * thinking_share)
+    limited = min(
+        output_tokens, max_tokens, thinking_budget + output_tokens - thinking_tokens
+    )
+
+    # The budget of the turn before, in the same transcript, for cache invalidations
+    previous_budget = None
+    ai_indices = [i for i, m in enumerate(messages) if m["type"] == "ai"]
+    if ai_indices:
+        previous = messages[: ai_indices[-1]]
+        turn, tool_results = get_signals(previous)
+        previous_budget = policy.get_settings(turn, tool_results, level)[0]
+    return {
+        "level": level,
+        "thinking_budget": thinking_budget,
+        "output_tokens": output_tokens,
+        "saved_tokens": output_tokens - limited,
+        "at_risk": limited < output_tokens,
+        "budget_changed": previous_budget not in (None, thinking_budget),
+    }
+
+
+def evaluate_transcripts(args):
+    policy = TurnPolicy("adaptive")
+    answer_files = args.answers or glob.glob(os.path.join(ANSWERS_DIRECTORY, "*.jsonl"))
+    answers = load_answers(answer_files)
+    paths = glob.glob(os.path.join(args.recordings, "*", "*.json"))
+    if not paths:
+        print(f"No recordings in {args.recordings}, record some with --llm-replay")
+        return
+
+    turns = []
+    questions = {}
+    for path in paths:
+        with open(path, "r") as f:
+            recording = json.load(f)
+        answer = find_answer(answers, recording["messages"])
+        result = evaluate_turn(policy, recording, answer)
+        turns.append(result)
+        if answer:
+            question = questions.setdefault(
+                answer["task_id"], {"correct": answer["is_correct"] is True}
+            )
+            question["at_risk"] = question.get("at_risk", False) or result["at_risk"]
+
+    output_tokens = sum(turn["output_tokens"] for turn in turns)
+    saved = sum(turn["saved_tokens"] for turn in turns)
+    budgets = {}
+    for turn in turns:
+        budgets[turn["thinking_budget"]] = budgets.get(turn["thinking_budget"], 0) + 1
+    print(f"{len(turns)} recorded turns, {output_tokens} output tokens")
+    print(
+        "turns by thinking budget: "
+        + ", ".join(f"{budget}: {count}" for budget, count in sorted(budgets.items()))
+    )
+    print(
+        f"saved: {saved} output tokens"
+        f" ({saved / max(output_tokens, 1):.1%}),"
+        f" ~{saved / args.output_tokens_per_second:.0f}s"
+        f" at {args.output_tokens_per_second} tokens/s"
+    )
+    print(
+        f"at risk: {sum(turn['at_risk'] for turn in turns)} turns;"
+        f" thinking budget changes (message cache invalidations):"
+        f" {sum(turn['budget_changed'] for turn in turns)}"
+    )
+    for level in sorted({str(turn["level"]) for turn in turns}):
+        level_turns = [turn for turn in turns if str(turn["level"]) == level]
+        level_output = sum(turn["output_tokens"] for turn in level_turns)
+        level_saved = sum(turn["saved_tokens"] for turn in level_turns)
+        print(
+            f"  level {level}: {len(level_turns)} turns,"
+            f" {level_saved}/{level_output} output tokens saved"
+        )
+
+    if not questions:
+        print("No transcripts matched an answer log, so accuracy isn't known")
+        return
+    correct = sum(question["correct"] for question in questions.values())
+    correct_at_risk = sum(
+        question["correct"] and question["at_risk"] for question in questions.values()
+    )
+    count = len(questions)
+    print(
+        f"{count} questions matched to answers: {correct}/{count} correct as recorded,"
+        f" {sum(q['at_risk'] for q in questions.values())} with a turn at risk"
+    )
+    print(
+        f"accuracy with the policy: between {(correct - correct_at_risk) / count:.1%}"
+        f" and {correct / count:.1%}"
+    )
+
+
+class UsageCountingLLM:
+    """Sums the output tokens and time of the calls made to the model it wraps"""
+
+    def __init__(self, llm):
+        self.llm = llm
+        self.output_tokens = 0
+        self.seconds = 0.0
+
+    async def ainvoke(self, messages, **kwargs):
+        start = time.perf_counter()
+        response = await self.llm.ainvoke(messages, **kwargs)
+        self.seconds += time.perf_counter() - start
+        usage = getattr(response, "usage_metadata", None) or {}
+        self.output_tokens += usage.get("output_tokens", 0)
+        return response
+
+
+async def run_live(questions, ground_truths, llm_replay):
+    from agent.gaia import llm_with_tools
+
+    variants = {}
+    for name in ("fixed", "adaptive"):
+        llm = llm_with_tools
+        if llm_replay:
+            llm = RecordReplayChatModel(model=llm, mode=llm_replay)
+        counter = UsageCountingLLM(llm)
+        variants[name] = (GaiaAgent(llm=counter, turn_policy=TurnPolicy(name)), counter)
+
+    correct = {name: 0 for name in variants}
+    print(f"{'task_id':<38} {'fixed tokens':>13} {'adaptive tokens':>16}")
+    for question, ground_truth in zip(questions, ground_truths):
+        tokens = {}
+        for name, (agent, counter) in variants.items():
+            before = counter.output_tokens
+            try:
+                answer = await agent.answer_question(question)
+            except Exception as e:
+                print(f"  {question['task_id']} failed with {name}: {e}")
+                answer = None
+            tokens[name] = counter.output_tokens - before
+            correct[name] += answer == ground_truth
+        print(
+            f"{question['task_id']:<38} {tokens['fixed']:>13}"
+            f" {tokens['adaptive']:>16}"
+        )
+
+    count = len(questions)
+    for name, (_, counter) in variants.items():
+        print(
+            f"{name}: {counter.output_tokens} output tokens,"
+            f" {counter.seconds:.0f}s in the model, {correct[name]}/{count} correct"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--recordings", default=RECORDINGS_DIRECTORY)
+    parser.add_argument("--answers", nargs="+", help="Answer logs (default: answers/)")
+    parser.add_argument(
+        "--output-tokens-per-second", type=float, default=OUTPUT_TOKENS_PER_SECOND
+    )
+    parser.add_argument("--live", action="store_true")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--llm-replay", choices=REPLAY_MODES)
+    args = parser.parse_args()
+
+    if not args.live:
+        evaluate_transcripts(args)
+        return
+
+    from utils.questions import QuestionProvider
+
+    questions, ground_truths = QuestionProvider().get_questions()
+    asyncio.run(
+        run_live(questions[: args.limit], ground_truths[: args.limit], args.llm_replay)
+    )
+
+
+if __name__ == "__main__":
+    main()
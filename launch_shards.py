@@ -0,0 +1,220 @@
+"""Spread an evaluation run over several processes, or machines, and merge the results.
+
+Each shard is a main.py process answering the questions of one shard of the split,
+logged as an mlflow run nested under one parent run. Once they finish, their answers
+and metrics are merged into the parent:
+
+    python launch_shards.py --shards 4 --concurrency 2
+
+Arguments other than the ones below are passed on to every main.py. To use other
+machines, create the parent run, start the shards wherever they should run, then
+merge them:
+
+    python launch_shards.py --shards 8 --parent-only
+    python main.py --shard 0/8 --parent-run-id RUN_ID    # ... up to 7/8
+    python launch_shards.py --merge RUN_NAME
+"""
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+
+from main import configure_mlflow, find_run_id, get_git_info
+from utils.questions import AnswerFileWriter
+
+logging.basicConfig(level=os.getenv("LOGLEVEL", "ERROR"))
+logger = logging.getLogger(__name__)
+
+ROOT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+ANSWERS_DIRECTORY = os.path.join(ROOT_DIRECTORY, "answers")
+LOGS_DIRECTORY = os.path.join(ROOT_DIRECTORY, "logs")
+
+# Metrics worked out again from the merged answers rather than added up
+RECOMPUTED_METRICS = ("total_correct", "total_attempted", "percent_correct")
+# Distribution statistics can't be combined from each shard's, so they are only
+# kept in the shards' runs
+UNMERGED_SUFFIXES = ("_mean", "_p50", "_p95", "_p99", "_fraction")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shards", type=int, help="Number of shards to split into")
+    parser.add_argument(
+        "--parent-only",
+        action="store_true",
+        help="Only create the parent run, for shards started on other machines",
+    )
+    parser.add_argument(
+        "--merge",
+        metavar="RUN_NAME",
+        help="Merge the shards of an existing parent run",
+    )
+    args, main_args = parser.parse_known_args()
+    if not args.merge and (args.shards is None or args.shards < 1):
+        parser.error("--shards must be at least 1 unless merging")
+    return args, main_args
+
+
+def launch(parent_run_id, parent_run_name, shards, main_args):
+    """Run every shard in its own process, returning whether they all succeeded"""
+    log_directory = os.path.join(LOGS_DIRECTORY, parent_run_name)
+    os.makedirs(log_directory, exist_ok=True)
+    processes = []
+    for index in range(shards):
+        command = [
+            sys.executable,
+            os.path.join(ROOT_DIRECTORY, "main.py"),
+            "--shard",
+            f"{index}/{shards}",
+            "--parent-run-id",
+            parent_run_id,
+            *main_args,
+        ]
+        log_file = os.path.join(log_directory, f"shard-{index}-of-{shards}.log")
+        with open(log_file, "w") as log:
+            processes.append(
+                subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT)
+            )
+        print(f"Started shard {index}/{shards}, logging to {log_file}")
+
+    succeeded = True
+    for index, process in enumerate(processes):
+        if process.wait() != 0:
+            print(f"Shard {index}/{shards} failed with exit code {process.returncode}")
+            succeeded = False
+    return succeeded
+
+
+def merge_metrics(child_runs):
+    """Add up the shards' counts and totals, keeping the largest of any maxima"""
+    merged = {}
+    for run in child_runs:
+        for name, value in run.data.metrics.items():
+            if name in RECOMPUTED_METRICS or name.endswith(UNMERGED_SUFFIXES):
+                continue
+            if name.endswith("_max") or name == "dataset_question_total":
+                merged[name] = max(merged.get(name, value), value)
+            else:
+                merged[name] = merged.get(name, 0) + value
+    return merged
+
+
+def read_shard_answers(mlflow, run):
+    """A shard's answers, from its logged artifact or else its answer log on this machine"""
+    try:
+        answers_file = mlflow.artifacts.download_artifacts(
+            run_id=run.info.run_id, artifact_path=f"{run.info.run_name}.json"
+        )
+    except Exception as e:
+        # A shard that crashed never logged its artifact, but its answer log has
+        # everything it answered up to then
+        answers_save_file = os.path.join(
+            ANSWERS_DIRECTORY, f"{run.info.run_name}.jsonl"
+        )
+        if not os.path.exists(answers_save_file):
+            print(f"No answers found for shard run {run.info.run_name}: {e}")
+            return None
+        print(
+            f"No answers logged for shard run {run.info.run_name},"
+            f" using its answer log {answers_save_file}"
+        )
+        return AnswerFileWriter(answers_save_file).read()
+    with open(answers_file, "r") as f:
+        return json.load(f)["answers"]
+
+
+def find_missing_shards(parent_run, child_runs):
+    """Shards the parent run expects that have no run"""
+    count = parent_run.data.params.get("shards")
+    if count is None:
+        # The parent of shards started by hand doesn't know how many there are
+        return []
+    found = {run.data.params.get("shard") for run in child_runs}
+    return [
+        f"{index}/{count}"
+        for index in range(int(count))
+        if f"{index}/{count}" not in found
+    ]
+
+
+def merge(mlflow, parent_run):
+    """Merge the answers and metrics of a parent run's shards into it.
+
+    Returns the shards that couldn't be merged, whose questions the merged totals
+    leave out.
+    """
+    parent_run_id = parent_run.info.run_id
+    child_runs = mlflow.search_runs(
+        experiment_ids=[parent_run.info.experiment_id],
+        filter_string=f"tags.mlflow.parentRunId = '{parent_run_id}'",
+        output_format="list",
+    )
+    shards = sorted(run.data.params.get("shard", "?") for run in child_runs)
+    print(f"Merging {len(child_runs)} shards: {', '.join(shards)}")
+
+    submit_answer = AnswerFileWriter(
+        os.path.join(ANSWERS_DIRECTORY, f"{parent_run.info.run_name}.jsonl")
+    )
+    missing = find_missing_shards(parent_run, child_runs)
+    for run in child_runs:
+        shard_answers = read_shard_answers(mlflow, run)
+        if shard_answers is None:
+            missing.append(run.data.params.get("shard", run.info.run_name))
+            continue
+        for answer in shard_answers:
+            submit_answer(answer)
+
+    answers = {answer["task_id"]: answer for answer in submit_answer.read()}
+    total_correct = sum(answer["is_correct"] is True for answer in answers.values())
+    total_attempted = len(answers)
+    with mlflow.start_run(run_id=parent_run_id):
+        mlflow.log_metrics(merge_metrics(child_runs))
+        mlflow.log_metric("total_correct", total_correct)
+        mlflow.log_metric("total_attempted", total_attempted)
+        if total_attempted:
+            mlflow.log_metric("percent_correct", total_correct / total_attempted * 100)
+        mlflow.log_metric("shards_merged", len(child_runs))
+        mlflow.log_metric("shards_missing", len(missing))
+        mlflow.log_artifact(submit_answer.finalize())
+    print(f"{total_correct}/{total_attempted} correct")
+    if missing:
+        print(
+            f"The merged totals are incomplete, with no answers from shards"
+            f" {', '.join(sorted(missing))}"
+        )
+    return missing
+
+
+def main():
+    args, main_args = parse_args()
+    mlflow = configure_mlflow()
+
+    if args.merge:
+        if merge(mlflow, mlflow.get_run(find_run_id(mlflow, args.merge))):
+            sys.exit(1)
+        return
+
+    git_info = get_git_info()
+    with mlflow.start_run() as parent_run:
+        mlflow.log_param("commit_hash", git_info["commit_hash"])
+        mlflow.log_param("commit_short", git_info["short_hash"])
+        mlflow.log_param("uncommitted_changes", git_info["has_uncommitted_changes"])
+        mlflow.log_param("shards", args.shards)
+        mlflow.log_param("main_args", " ".join(main_args))
+    parent_run_id = parent_run.info.run_id
+    parent_run_name = parent_run.info.run_name
+    print(f"Parent run {parent_run_name} ({parent_run_id})")
+    if args.parent_only:
+        return
+
+    succeeded = launch(parent_run_id, parent_run_name, args.shards, main_args)
+    missing = merge(mlflow, mlflow.get_run(parent_run_id))
+    if not succeeded or missing:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
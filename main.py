@@ -1,19 +1,32 @@
+import argparse
+import asyncio
 import logging
 import os
-import mlflow
 import subprocess
-from agent.gaia import GaiaAgent
+from utils.instrumentation import instrumentation
+from utils.prefetch import AttachmentPrefetcher
 from utils.questions import QuestionProvider, AnswerFileWriter
 from utils.stream_handlers import MessageChunkPrinter
+from utils.telemetry import OUTPUTS, TelemetrySink
 from typing import Dict, Union
 
 
 logging.basicConfig(level=os.getenv("LOGLEVEL", "ERROR"))
 logger = logging.getLogger(__name__)
 
-mlflow.set_experiment("gaia-agent")
-mlflow.langchain.autolog()
-mlflow.anthropic.autolog()
+# The agent is imported by the functions that run it rather than here. Spawned
+# processes, such as the attachment prefetcher's workers, import this module before
+# anything else, and shouldn't have to load the agent and compile its graph.
+
+
+def configure_mlflow():
+    """Import and set up mlflow, which is slow to import, only once a run starts"""
+    import mlflow
+
+    mlflow.set_experiment("gaia-agent")
+    mlflow.langchain.autolog()
+    mlflow.anthropic.autolog()
+    return mlflow
 
 
 def get_git_info() -> Dict[str, Union[str, bool]]:
@@ -39,69 +52,278 @@ def get_git_info() -> Dict[str, Union[str, bool]]:
         return {"error": f"Git command failed: {e}"}
 
 
-def create_answer_result(question, ground_truth, agent_answer, error=None):
+def create_answer_result(
+    question, ground_truth, agent_answer, error=None, termination_reason=None
+):
     """Create a standardized result dictionary"""
     return {
         "task_id": question["task_id"],
         "question": question["question"],
+        "level": question.get("Level"),
         "agent_answer": agent_answer if error is None else f"Error: {error}",
         "ground_truth": ground_truth,
         "is_correct": agent_answer == ground_truth if error is None else False,
+        "termination_reason": termination_reason if error is None else "error",
     }
 
+
+def is_error_result(result):
+    return str(result["agent_answer"]).startswith("Error: ")
+
+
+def get_completed_results(submit_answer):
+    """Results already in a run's answer log that don't need to be answered again"""
+    completed = {}
+    for result in submit_answer.read():
+        if not is_error_result(result):
+            completed[result["task_id"]] = result
+    return completed
+
+
+def find_run_id(mlflow, run_name):
+    runs = mlflow.search_runs(
+        experiment_names=["gaia-agent"],
+        filter_string=f"tags.mlflow.runName = '{run_name}'",
+        output_format="list",
+    )
+    if not runs:
+        raise SystemExit(f"No run named {run_name} to resume")
+    return runs[0].info.run_id
+
+
+def parse_shard(value):
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a shard like 0/4, got {value}")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(
+            f"the shard index of {value} must be from 0 to {count - 1}"
+        )
+    return index, count
+
+
+def parse_args():
+    from agent.replay import REPLAY_MODES
+
+    parser = argparse.ArgumentParser(description="Evaluate the agent on GAIA questions")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="Maximum number of questions to answer at the same time",
+    )
+    parser.add_argument(
+        "--resume",
+        metavar="RUN_NAME",
+        help="Continue an interrupted run, skipping questions it already answered",
+    )
+    parser.add_argument(
+        "--llm-replay",
+        choices=REPLAY_MODES,
+        help="Record LLM responses to disk, replay them, or replay and record misses",
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        metavar="I/N",
+        help="Only answer shard I (counting from 0) of N, split stably by task id",
+    )
+    parser.add_argument(
+        "--parent-run-id",
+        help="Log the run nested under this mlflow run, as launch_shards.py does",
+    )
+    parser.add_argument(
+        "--stream-output",
+        choices=OUTPUTS,
+        default="prefixed",
+        help="Print the LLM's output with each line prefixed by its task id, write it"
+        " to a log file per question, or drop it",
+    )
+    args = parser.parse_args()
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    return args
+
+
+async def answer_questions(
+    agent,
+    questions,
+    ground_truths,
+    submit_answer,
+    concurrency,
+    telemetry,
+    *,
+    total_correct=0,
+    total_attempted=0,
+):
+    """Answer questions concurrently, recording each result as soon as it completes.
+
+    The running totals start from total_correct and total_attempted, so a resumed run
+    continues its metrics from where it stopped. Output and metrics go through the
+    telemetry sink, so that answering never waits on stdout or mlflow.
+    """
+    from agent.message_history import prompt_cache_stats
+    from agent.rate_limiter import rate_limiter
+    from agent.search_cache import get_search_cache
+    from agent.web_search import search_client
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def attempt(question, ground_truth):
+        async with semaphore:
+            logger.info(f"Running query for question {question["question"]}")
+            logger.info(question["file_name"])
+            printer = MessageChunkPrinter(write=telemetry.writer(question["task_id"]))
+            try:
+                record = await agent.get_answer_record(
+                    question, handle_message_chunk=printer
+                )
+                logger.info(
+                    f"Agent answer: {record['agent_answer']}"
+                    f" ({record['termination_reason']})"
+                )
+                return create_answer_result(
+                    question,
+                    ground_truth,
+                    record["agent_answer"],
+                    termination_reason=record["termination_reason"],
+                )
+            except Exception as e:
+                return create_answer_result(question, ground_truth, None, error=e)
+            finally:
+                telemetry.end_question(question["task_id"])
+
+    attempts = [
+        asyncio.create_task(attempt(question, ground_truth))
+        for question, ground_truth in zip(questions, ground_truths)
+    ]
+
+    try:
+        # Results arrive in completion order, so the running totals are only ever
+        # updated here, from the single loop that consumes them.
+        for completed in asyncio.as_completed(attempts):
+            result = await completed
+            total_attempted += 1
+            if result["is_correct"] is True:
+                total_correct += 1
+
+            submit_answer(result)
+
+            metrics = {
+                "total_correct": total_correct,
+                "percent_correct": (total_correct / total_attempted) * 100,
+                **rate_limiter.metrics(),
+                **get_search_cache().metrics(),
+                **prompt_cache_stats.metrics(),
+                **instrumentation.metrics(),
+            }
+            telemetry.log_metrics(metrics, step=total_attempted)
+    finally:
+        # The pooled search connections belong to this event loop
+        await search_client.aclose()
+
+
 def main():
+    from agent.gaia import GaiaAgent, llm_with_tools
+    from agent.replay import RecordReplayChatModel
+
+    args = parse_args()
+    mlflow = configure_mlflow()
     git_info = get_git_info()
-    with mlflow.start_run():
+    run_id = find_run_id(mlflow, args.resume) if args.resume else None
+    # A resumed run is already nested under its parent, if it has one
+    parent_run_id = args.parent_run_id if run_id is None else None
+    with mlflow.start_run(run_id=run_id, parent_run_id=parent_run_id):
         current_run = mlflow.active_run()
-        mlflow.log_param("commit_hash", git_info["commit_hash"])
-        mlflow.log_param("commit_short", git_info["short_hash"])
-        mlflow.log_param("uncommitted_changes", git_info["has_uncommitted_changes"])
+        if args.resume:
+            # Params can't be changed once logged, so a resumed run records tags
+            mlflow.set_tag("resumed_commit_hash", git_info["commit_hash"])
+            mlflow.set_tag("resumed_concurrency", args.concurrency)
+        else:
+            mlflow.log_param("commit_hash", git_info["commit_hash"])
+            mlflow.log_param("commit_short", git_info["short_hash"])
+            mlflow.log_param("uncommitted_changes", git_info["has_uncommitted_changes"])
+            mlflow.log_param("concurrency", args.concurrency)
+            if args.shard:
+                mlflow.log_param("shard", f"{args.shard[0]}/{args.shard[1]}")
 
         answers_artifact_directory = os.path.join(os.path.dirname(__file__), "answers")
         os.makedirs(answers_artifact_directory, exist_ok=True)
         answers_save_file = os.path.join(
-            answers_artifact_directory, f"{current_run.info.run_name}.json"
+            answers_artifact_directory, f"{current_run.info.run_name}.jsonl"
         )
         submit_answer = AnswerFileWriter(answers_save_file)
 
         question_provider = QuestionProvider()
         total_questions = question_provider.get_question_count()
-        questions, ground_truths = question_provider.get_questions()
-
-        total_correct = 0
-        total_attempted = 0
+        questions, ground_truths = question_provider.get_questions(shard=args.shard)
 
         mlflow.log_metric("question_sample_size", len(questions))
         mlflow.log_metric("dataset_question_total", total_questions)
-        for i in range(len(questions)):
-            total_attempted += 1
-            question = questions[i]
-            ground_truth = ground_truths[i]
-            logger.info(f"Running query for question {question["question"]}")
-            logger.info(question["file_name"])
 
-            agent = GaiaAgent(handle_message_chunk=MessageChunkPrinter())
-            is_correct = False
+        completed = get_completed_results(submit_answer) if args.resume else {}
+        remaining = [
+            (question, ground_truth)
+            for question, ground_truth in zip(questions, ground_truths)
+            if question["task_id"] not in completed
+        ]
+        if completed:
+            logger.info(
+                f"Resuming {args.resume}: {len(completed)} questions already answered,"
+                f" {len(remaining)} remaining"
+            )
 
-            result = None
-            try:
-                agent_answer = agent(question)
-                logger.info(f"Agent answer: {agent_answer}")
-                result = create_answer_result(question, ground_truth, agent_answer)
-                if result["is_correct"] is True:
-                    total_correct += 1
-            except Exception as e:
-                result = create_answer_result(question, ground_truth, None, error=e)
+        llm = llm_with_tools
+        if args.llm_replay:
+            llm = RecordReplayChatModel(model=llm_with_tools, mode=args.llm_replay)
+            mlflow.set_tag("llm_replay", args.llm_replay)
 
-            submit_answer(result)
+        prefetcher = None
+        if os.getenv("GAIA_PREFETCH", "1") == "1":
+            # Shards run side by side on the same machine, and share its cores
+            prefetcher = AttachmentPrefetcher.from_env(
+                processes=args.shard[1] if args.shard else 1
+            )
+            prefetcher.start([question for question, _ in remaining])
 
-            mlflow.log_metric("total_correct", total_correct)
-            percent_correct = (total_correct / total_attempted) * 100
-            mlflow.log_metric("percent_correct", percent_correct)
-            if is_correct:
-                total_correct += 1
+        log_directory = None
+        if args.stream_output == "files":
+            log_directory = os.path.join(
+                os.path.dirname(__file__), "logs", current_run.info.run_name
+            )
+            os.makedirs(log_directory, exist_ok=True)
+        telemetry = TelemetrySink.from_env(
+            output=args.stream_output,
+            log_directory=log_directory,
+            run_id=current_run.info.run_id,
+            client=mlflow.MlflowClient(),
+        )
+
+        # A single agent (and so a single compiled graph) serves every question
+        agent = GaiaAgent(llm=llm, prefetcher=prefetcher)
+        try:
+            asyncio.run(
+                answer_questions(
+                    agent,
+                    [question for question, _ in remaining],
+                    [ground_truth for _, ground_truth in remaining],
+                    submit_answer,
+                    args.concurrency,
+                    telemetry,
+                    total_correct=sum(
+                        result["is_correct"] is True for result in completed.values()
+                    ),
+                    total_attempted=len(completed),
+                )
+            )
+        finally:
+            telemetry.close()
+            if prefetcher:
+                prefetcher.shutdown()
 
-        mlflow.log_artifact(answers_save_file)
+        mlflow.log_artifact(submit_answer.finalize())
+        mlflow.log_dict(instrumentation.summary(), "instrumentation.json")
 
 
 if __name__ == "__main__":
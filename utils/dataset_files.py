@@ -0,0 +1,78 @@
+import os
+import logging
+from functools import cache
+from huggingface_hub import constants, hf_hub_download, list_repo_files
+
+logger = logging.getLogger(__name__)
+
+DATASET_REPO_ID = "gaia-benchmark/GAIA"
+DATASET_SPLIT_DIRECTORY = "2023/validation"
+DOWNLOAD_DIRECTORY = os.path.join(os.path.dirname(__file__), "../", "downloaded_files")
+
+
+class DatasetFileResolver:
+    """Resolves GAIA attachment file names to paths on disk.
+
+    Files already on disk are indexed once, so resolving them costs a dict lookup. A
+    miss downloads just that file from the Hub, unless the resolver is offline, in
+    which case only the local index is used.
+    """
+
+    def __init__(self, directory=DOWNLOAD_DIRECTORY, offline=False):
+        self.directory = directory
+        self.offline = offline
+        self.split_directory = os.path.join(directory, DATASET_SPLIT_DIRECTORY)
+        os.makedirs(self.split_directory, exist_ok=True)
+        self.index = self.build_index()
+        logger.info(
+            f"Indexed {len(self.index)} dataset files in {self.split_directory}"
+            f"{' (offline)' if offline else ''}"
+        )
+
+    def build_index(self):
+        with os.scandir(self.split_directory) as entries:
+            return {entry.name: entry.path for entry in entries if entry.is_file()}
+
+    def download(self, file_name):
+        logger.info(f"Downloading {file_name} from {DATASET_REPO_ID}...")
+        return hf_hub_download(
+            repo_id=DATASET_REPO_ID,
+            repo_type="dataset",
+            filename=f"{DATASET_SPLIT_DIRECTORY}/{file_name}",
+            local_dir=self.directory,
+        )
+
+    def list_files(self):
+        """Names of every file in the split, or just the indexed ones when offline"""
+        if self.offline:
+            return sorted(self.index)
+        prefix = f"{DATASET_SPLIT_DIRECTORY}/"
+        return [
+            path.removeprefix(prefix)
+            for path in list_repo_files(DATASET_REPO_ID, repo_type="dataset")
+            if path.startswith(prefix) and "/" not in path.removeprefix(prefix)
+        ]
+
+    def resolve(self, file_name):
+        if file_name in self.index:
+            return self.index[file_name]
+        if self.offline:
+            raise FileNotFoundError(
+                f"{file_name} is not in the local dataset index and downloads are disabled"
+            )
+        path = self.download(file_name)
+        self.index[file_name] = path
+        return path
+
+
+def is_offline():
+    return os.getenv("GAIA_DATASET_OFFLINE") == "1" or constants.HF_HUB_OFFLINE
+
+
+@cache
+def get_dataset_file_resolver():
+    """The process-wide resolver, created on first use"""
+    return DatasetFileResolver(
+        directory=os.getenv("GAIA_DOWNLOAD_DIRECTORY", DOWNLOAD_DIRECTORY),
+        offline=is_offline(),
+    )
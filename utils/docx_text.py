@@ -0,0 +1,225 @@
+"""Text of a docx file, read straight from its XML.
+
+Produces the same text as walking the document with python-docx: a line per
+non-empty paragraph, "# " before headings, and a "| a | b |" line per table row with
+merged cells repeated in every grid column they span. python-docx builds an object
+for every element and resolves merged cells by searching back through the table,
+which is quadratic in its size. Here word/document.xml is streamed with iterparse,
+each paragraph or table row is turned into text as soon as it ends and then
+discarded, heading styles are worked out once from styles.xml, and each row's merged
+cells are looked up in the row before.
+"""
+
+import posixpath
+import zipfile
+from xml.etree.ElementTree import iterparse, parse
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+RELATIONSHIP = (
+    "{http://schemas.openxmlformats.org/package/2006/relationships}Relationship"
+)
+
+BODY = f"{W}body"
+PARAGRAPH = f"{W}p"
+TABLE = f"{W}tbl"
+ROW = f"{W}tr"
+CELL = f"{W}tc"
+RUN = f"{W}r"
+HYPERLINK = f"{W}hyperlink"
+TEXT = f"{W}t"
+BREAK = f"{W}br"
+VAL = f"{W}val"
+
+# The text of each element inside a run that has any
+RUN_CHARACTERS = {
+    f"{W}tab": "\t",
+    f"{W}ptab": "\t",
+    f"{W}cr": "\n",
+    f"{W}noBreakHyphen": "-",
+}
+# python-docx gives these built-in styles their capitalized names
+HEADING_STYLE_NAMES = {f"heading {level}" for level in range(1, 10)}
+
+
+def get_part_name(relationships, relationship_type, source=""):
+    """The zip entry of the part a relationship of relationship_type points to"""
+    if relationships is None:
+        return None
+    for relationship in relationships.iter(RELATIONSHIP):
+        if relationship.get("TargetMode") == "External":
+            continue
+        if relationship.get("Type", "").endswith(f"/{relationship_type}"):
+            # Targets are relative to the source part's directory, or absolute
+            target = posixpath.join(
+                "/", posixpath.dirname(source), relationship.get("Target")
+            )
+            return posixpath.normpath(target).lstrip("/")
+    return None
+
+
+def read_relationships(archive, part_name):
+    directory, name = posixpath.split(part_name)
+    relationships_name = posixpath.join(directory, "_rels", f"{name}.rels")
+    if relationships_name not in archive.NameToInfo:
+        return None
+    with archive.open(relationships_name) as f:
+        return parse(f).getroot()
+
+
+def is_heading_name(name):
+    return name is not None and (
+        name.startswith("Heading") or name in HEADING_STYLE_NAMES
+    )
+
+
+class HeadingStyles:
+    """Which paragraph style ids are headings, resolved as python-docx does"""
+
+    def __init__(self, styles=None):
+        # The first style with an id is the one used, and only paragraph styles count
+        self.headings = {}
+        self.default_is_heading = False
+        if styles is None:
+            return
+        for style in styles.findall(f"{W}style"):
+            is_paragraph = style.get(f"{W}type") == "paragraph"
+            name = style.find(f"{W}name")
+            is_heading = is_heading_name(name.get(VAL) if name is not None else None)
+            style_id = style.get(f"{W}styleId")
+            if style_id not in self.headings:
+                self.headings[style_id] = is_heading if is_paragraph else None
+            # The last default paragraph style is the default
+            if is_paragraph and style.get(f"{W}default") in ("1", "true", "on"):
+                self.default_is_heading = is_heading
+
+    def is_heading(self, paragraph):
+        properties = paragraph.find(f"{W}pPr")
+        style = properties.find(f"{W}pStyle") if properties is not None else None
+        style_id = style.get(VAL) if style is not None else None
+        is_heading = self.headings.get(style_id) if style_id else None
+        return self.default_is_heading if is_heading is None else is_heading
+
+
+def run_text(run):
+    parts = []
+    for child in run:
+        if child.tag == TEXT:
+            parts.append(child.text or "")
+        elif child.tag == BREAK:
+            # Page and column breaks have no text
+            if child.get(f"{W}type", "textWrapping") == "textWrapping":
+                parts.append("\n")
+        elif child.tag in RUN_CHARACTERS:
+            parts.append(RUN_CHARACTERS[child.tag])
+    return "".join(parts)
+
+
+def paragraph_text(paragraph):
+    """The text of a body paragraph's own runs"""
+    return "".join(run_text(child) for child in paragraph if child.tag == RUN)
+
+
+def cell_paragraph_text(paragraph):
+    """The text of a table cell's paragraph, which includes its hyperlinks"""
+    parts = []
+    for child in paragraph:
+        if child.tag == RUN:
+            parts.append(run_text(child))
+        elif child.tag == HYPERLINK:
+            parts.extend(run_text(run) for run in child if run.tag == RUN)
+    return "".join(parts)
+
+
+def get_int_property(element, properties_tag, tag, default):
+    properties = element.find(properties_tag)
+    value = properties.find(tag) if properties is not None else None
+    return int(value.get(VAL)) if value is not None else default
+
+
+def get_vertical_merge(cell):
+    properties = cell.find(f"{W}tcPr")
+    merge = properties.find(f"{W}vMerge") if properties is not None else None
+    return merge.get(VAL, "continue") if merge is not None else None
+
+
+class TableRows:
+    """Turns a table's rows into lines, one row at a time"""
+
+    def __init__(self):
+        # The text and width of the cell in each grid column of the previous row
+        self.previous_row = {}
+
+    def row_text(self, row):
+        offset = get_int_property(row, f"{W}trPr", f"{W}gridBefore", 0)
+        current_row = {}
+        cells = []
+        for cell in row:
+            if cell.tag != CELL:
+                continue
+            span = get_int_property(cell, f"{W}tcPr", f"{W}gridSpan", 1)
+            merged = None
+            if get_vertical_merge(cell) == "continue":
+                # The rest of a vertically merged cell shows the text of its first
+                # cell, spanning as many columns
+                merged = self.previous_row.get(offset)
+            if merged is None:
+                text = "\n".join(
+                    cell_paragraph_text(paragraph)
+                    for paragraph in cell
+                    if paragraph.tag == PARAGRAPH
+                )
+                merged = (text.strip().replace("\n", " "), span)
+            current_row[offset] = merged
+            text, width = merged
+            cells.extend([text] * width)
+            offset += span
+        self.previous_row = current_row
+        return "| " + " | ".join(cells) + " |"
+
+
+def docx_to_text(file_path):
+    with zipfile.ZipFile(file_path) as archive:
+        # The parts are found through their relationships, as they needn't be at
+        # their usual paths
+        document_name = (
+            get_part_name(read_relationships(archive, ""), "officeDocument")
+            or "word/document.xml"
+        )
+        styles_name = get_part_name(
+            read_relationships(archive, document_name), "styles", document_name
+        )
+        styles = None
+        if styles_name in archive.NameToInfo:
+            with archive.open(styles_name) as f:
+                styles = parse(f).getroot()
+        # Without a styles part python-docx falls back to its template's styles,
+        # which only a generated document with no styles of its own would rely on
+        heading_styles = HeadingStyles(styles)
+
+        lines = []
+        # The open elements, from the document down
+        path = []
+        table_rows = None
+        with archive.open(document_name) as f:
+            for event, element in iterparse(f, events=("start", "end")):
+                if event == "start":
+                    path.append(element)
+                    if len(path) == 3 and element.tag == TABLE and path[1].tag == BODY:
+                        table_rows = TableRows()
+                    continue
+                path.pop()
+                if len(path) == 3 and element.tag == ROW and path[1].tag == BODY:
+                    if path[2].tag == TABLE:
+                        lines.append(table_rows.row_text(element))
+                        path[2].remove(element)
+                elif len(path) == 2 and path[1].tag == BODY:
+                    if element.tag == PARAGRAPH:
+                        text = paragraph_text(element).strip()
+                        if text:
+                            if heading_styles.is_heading(element):
+                                lines.append(f"# {text}")
+                            else:
+                                lines.append(text)
+                    # Each block is finished with once it ends
+                    path[-1].remove(element)
+        return "\n".join(lines)
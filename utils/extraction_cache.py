@@ -0,0 +1,138 @@
+import argparse
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from functools import cache
+
+logger = logging.getLogger(__name__)
+
+CACHE_FILE = os.path.join(
+    os.path.dirname(__file__), "../", "cache", "extractions.sqlite3"
+)
+DEFAULT_MAX_MEGABYTES = 512
+
+
+def hash_file(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        while chunk := file.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """Persistent cache of extracted text keyed by file content hash and extractor version.
+
+    Entries live in SQLite, so every write is atomic and the cache can be shared by
+    several processes. When the stored text exceeds max_bytes the least recently used
+    entries are evicted.
+    """
+
+    def __init__(self, cache_file=CACHE_FILE, max_bytes=DEFAULT_MAX_MEGABYTES * 2**20):
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        self.connection = sqlite3.connect(
+            cache_file, timeout=30, check_same_thread=False
+        )
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS extractions (
+                    key TEXT PRIMARY KEY,
+                    text TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """)
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS extractions_last_access"
+                " ON extractions (last_access)"
+            )
+
+    @staticmethod
+    def make_key(file_path, extractor_version):
+        return f"{hash_file(file_path)}:{extractor_version}"
+
+    def get(self, key):
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                "SELECT text FROM extractions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.connection.execute(
+                "UPDATE extractions SET last_access = ? WHERE key = ?",
+                (time.time(), key),
+            )
+            return row[0]
+
+    def put(self, key, text):
+        size = len(text.encode("utf-8"))
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO extractions VALUES (?, ?, ?, ?)",
+                (key, text, size, time.time()),
+            )
+            self.evict()
+
+    def evict(self):
+        (total,) = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM extractions"
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+        rows = self.connection.execute(
+            "SELECT key, size FROM extractions ORDER BY last_access"
+        ).fetchall()
+        evicted = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        self.connection.executemany("DELETE FROM extractions WHERE key = ?", evicted)
+        logger.info(f"Evicted {len(evicted)} entries from the extraction cache")
+
+
+@cache
+def get_extraction_cache():
+    """The process-wide extraction cache, created on first use"""
+    return ExtractionCache(
+        cache_file=os.getenv("GAIA_EXTRACTION_CACHE", CACHE_FILE),
+        max_bytes=int(os.getenv("GAIA_EXTRACTION_CACHE_MAX_MB", DEFAULT_MAX_MEGABYTES))
+        * 2**20,
+    )
+
+
+def warm():
+    """Extract every supported attachment in the dataset into the cache"""
+    from utils.dataset_files import get_dataset_file_resolver
+    from utils.file_extractors import FileExtractor, supported_file_types
+
+    file_names = get_dataset_file_resolver().list_files()
+    for file_name in file_names:
+        extension = os.path.splitext(file_name)[1].lstrip(".").lower()
+        if extension not in supported_file_types:
+            continue
+        try:
+            FileExtractor(file_name)()
+            print(f"Cached {file_name}")
+        except Exception as e:
+            print(f"Failed to extract {file_name}: {e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the extracted text cache")
+    parser.add_argument(
+        "--warm",
+        action="store_true",
+        help="Extract every attachment in the dataset into the cache",
+    )
+    if parser.parse_args().warm:
+        warm()
+    else:
+        parser.print_help()
@@ -1,37 +1,26 @@
 import os
 import logging
-import torch
-from huggingface_hub import snapshot_download
-from docx import Document
-from docx.text.paragraph import Paragraph
-from docx.table import Table
-from openpyxl import load_workbook
-from openpyxl.styles.colors import RGB
-from transformers import pipeline
+from utils.dataset_files import get_dataset_file_resolver
+from utils.docx_text import docx_to_text
+from utils.extraction_cache import ExtractionCache, get_extraction_cache
+from utils.instrumentation import instrumentation
+from utils.transcription import TranscriptionConfig, transcribe
 
 logger = logging.getLogger(__name__)
 
 supported_file_types = ["docx", "xlsx", "py", "mp3"]
 
-device = "cuda:0" if torch.cuda.is_available() else "cpu"
-whisper = pipeline(
-    "automatic-speech-recognition",
-    "openai/whisper-small",
-    chunk_length_s=30,
-    device=device,
-)
+# Part of the extraction cache key: bump an extractor's version whenever a change to
+# it would alter its output, so stale cached text is not reused.
+extractor_versions = {"docx": "1", "xlsx": "2", "py": "1", "mp3": "1"}
+
+# Spreadsheets are summarized rather than inlined beyond this many characters
+XLSX_MAX_CHARACTERS = int(os.getenv("GAIA_XLSX_MAX_CHARACTERS", 200000))
 
 
 class FileExtractor:
     def __init__(self, file_name):
-        directory = os.path.join(os.path.dirname(__file__), "../", "downloaded_files")
-        os.makedirs(directory, exist_ok=True)
-        snapshot_download(
-            repo_id="gaia-benchmark/GAIA", repo_type="dataset", local_dir=directory
-        )
-
         self.file_name = file_name
-        self.file_path = os.path.join(directory, "2023/validation", self.file_name)
 
         logger.info(f"Creating file extractor for {file_name}")
         is_supported = self.is_file_supported()
@@ -40,9 +29,24 @@ class FileExtractor:
                 f"Unable to parse file {file_name}: file type not supported"
             )
 
+        self.file_path = get_dataset_file_resolver().resolve(self.file_name)
+        self.transcription_config = TranscriptionConfig.from_env()
+        self.xlsx_max_characters = XLSX_MAX_CHARACTERS
+
     def get_extension(self):
         return os.path.splitext(self.file_name)[1].lstrip(".").lower()
 
+    def get_extractor_version(self):
+        extension = self.get_extension()
+        version = extractor_versions[extension]
+        if extension == "mp3":
+            # Transcripts depend on how whisper was run as well as on the code
+            version += f"-{self.transcription_config.cache_tag()}"
+        elif extension == "xlsx":
+            # Larger spreadsheets are cut off at the character cap
+            version += f"-{self.xlsx_max_characters}"
+        return version
+
     def is_file_supported(self):
         extension = self.get_extension()
         logger.info(f"Checking for file support for {extension}...")
@@ -54,63 +58,90 @@ class FileExtractor:
         logger.info("File type is not supported.")
         return False
 
-    def iter_block_items(self, parent):
-        for child in parent.element.body:
-            if child.tag.endswith("p"):
-                yield Paragraph(child, parent)
-            elif child.tag.endswith("tbl"):
-                yield Table(child, parent)
-
     def docx_to_text(self):
-        doc = Document(self.file_path)
-        lines = []
-        for block in self.iter_block_items(doc):
-            if isinstance(block, Paragraph):
-                style = block.style.name
-                text = "".join(run.text for run in block.runs).strip()
-                if not text:
-                    continue
-                if style.startswith("Heading"):
-                    lines.append(f"# {text}")
-                else:
-                    lines.append(text)
-            elif isinstance(block, Table):
-                for row in block.rows:
-                    cells = [cell.text.strip().replace("\n", " ") for cell in row.cells]
-                    lines.append("| " + " | ".join(cells) + " |")
-        return "\n".join(lines)
+        return docx_to_text(self.file_path)
+
+    def get_fill_annotation(self, fill):
+        """The note added to a cell with a fill"""
+        from openpyxl.styles.colors import RGB
+
+        # Gradient fills have no start color
+        color = getattr(fill, "start_color", None)
+        rgb = color.rgb if color is not None else "00000000"
+        # If the cell had a color other than the default background, include
+        # it with the cell value to the LLM can be aware.
+        # Sometimes the colors are an RGB class which we will ignore for now.
+        if rgb != "00000000" and not isinstance(rgb, RGB):
+            return f" (#{rgb})"
+        return ""
 
     def xlsx_to_text(self):
-        wb = load_workbook(self.file_path, data_only=True)
-        lines = []
-        for sheet in wb.sheetnames:
-            ws = wb[sheet]
-            lines.append(f"# Sheet: {sheet}")
-            for row in ws.iter_rows(values_only=False):
-                if all(cell is None for cell in row):
-                    continue
-
-                row_text = ""
-                for cell in row:
-                    if cell is not None:
-                        row_text += str(cell.value)
-                        # If the cell had a color other than the default background, include
-                        # it with the cell value to the LLM can be aware.
-                        # Sometimes the colors are an RGB class which we will ignore for now.
-                        if cell.fill.start_color.rgb != "00000000" and not isinstance(
-                            cell.fill.start_color.rgb, RGB
-                        ):
-                            row_text += f" (#{cell.fill.start_color.rgb})"
-                        row_text += " | "
-                    else:
-                        row_text += " | "
-
-                lines.append(row_text)
-        return "\n".join(lines)
+        from openpyxl import load_workbook
+
+        # Read-only mode streams rows from the file instead of loading every cell
+        wb = load_workbook(self.file_path, read_only=True, data_only=True)
+        try:
+            # Cells share the workbook's fill objects, so each is worked out once
+            fill_annotations = {}
+            lines = []
+            size = 0
+            for sheet in wb.sheetnames:
+                ws = wb[sheet]
+                # Read-only sheets trust the dimensions stored in the file, which
+                # can be stale, so the rows are read until they run out instead
+                if hasattr(ws, "reset_dimensions"):
+                    ws.reset_dimensions()
+                lines.append(f"# Sheet: {sheet}")
+                # Empty rows are only written once a later row has content, which
+                # drops trailing empty rows without holding any rows in memory
+                pending_empty_rows = 0
+                omitted_rows = omitted_cells = 0
+                for row in ws.iter_rows():
+                    cells = []
+                    filled_cell_count = last_filled = 0
+                    for cell in row:
+                        annotation = ""
+                        if getattr(cell, "has_style", False):
+                            fill = cell.fill
+                            annotation = fill_annotations.get(id(fill))
+                            if annotation is None:
+                                annotation = fill_annotations[id(fill)] = (
+                                    self.get_fill_annotation(fill)
+                                )
+                        cells.append(f"{cell.value}{annotation} | ")
+                        if cell.value is not None or annotation:
+                            filled_cell_count += 1
+                            last_filled = len(cells)
+
+                    if not filled_cell_count:
+                        pending_empty_rows += 1
+                        continue
+                    if size > self.xlsx_max_characters:
+                        # Over the cap, summarize the rest instead of inlining it
+                        omitted_rows += 1
+                        omitted_cells += filled_cell_count
+                        continue
+
+                    lines.extend([""] * pending_empty_rows)
+                    pending_empty_rows = 0
+                    # Trailing empty columns are dropped
+                    row_text = "".join(cells[:last_filled])
+                    lines.append(row_text)
+                    size += len(row_text) + 1
+
+                if omitted_rows:
+                    lines.append(
+                        f"[{omitted_rows} more rows with {omitted_cells} non-empty"
+                        f" cells not shown: the {self.xlsx_max_characters} character"
+                        " limit for spreadsheets was reached]"
+                    )
+            return "\n".join(lines)
+        finally:
+            # Read-only workbooks keep the file open until closed
+            wb.close()
 
     def mp3_to_text(self):
-        result = whisper(self.file_path, return_timestamps=True)
-        return result["text"]
+        return transcribe(self.file_path, self.transcription_config)
 
     def raw_file_to_text(self):
         with open(self.file_path, mode="r", encoding="utf-8") as file:
@@ -137,7 +168,19 @@ class FileExtractor:
         logger.info(f"Extracting file contents from {self.file_name}...")
         if os.path.exists(self.file_path):
             logger.info("File exists on disk.")
-            text = self.extract_text()
+            extraction_cache = get_extraction_cache()
+            cache_key = ExtractionCache.make_key(
+                self.file_path, self.get_extractor_version()
+            )
+            text = extraction_cache.get(cache_key)
+            if text is not None:
+                logger.info("Text found in extraction cache.")
+                instrumentation.increment("extraction_cache_hits")
+                return text
+            instrumentation.increment("extraction_cache_misses")
+            with instrumentation.timer(f"extract_{self.get_extension()}_seconds"):
+                text = self.extract_text()
+            extraction_cache.put(cache_key, text)
             logger.info("Text extracted from file.")
             return text
         else:
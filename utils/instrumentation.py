@@ -0,0 +1,172 @@
+import logging
+import math
+import os
+import random
+import time
+from contextlib import contextmanager
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+logger = logging.getLogger(__name__)
+
+# Beyond this many samples a histogram keeps a uniform random sample of them, so
+# memory stays bounded however long a run is. Counts, sums and maxima stay exact.
+MAX_SAMPLES = 10000
+PERCENTILES = (50, 95, 99)
+
+
+class Histogram:
+    def __init__(self, max_samples=MAX_SAMPLES):
+        self.max_samples = max_samples
+        self.samples = []
+        self.count = 0
+        self.total = 0.0
+        self.max = -math.inf
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        if len(self.samples) < self.max_samples:
+            self.samples.append(value)
+        else:
+            # Reservoir sampling: every value seen has the same chance to be kept
+            i = random.randrange(self.count)
+            if i < self.max_samples:
+                self.samples[i] = value
+
+    def percentile(self, sorted_samples, percent):
+        """Nearest-rank percentile"""
+        rank = max(math.ceil(percent / 100 * len(sorted_samples)), 1)
+        return sorted_samples[rank - 1]
+
+    def summary(self):
+        sorted_samples = sorted(self.samples)
+        summary = {
+            "count": self.count,
+            "mean": self.total / self.count,
+            "max": self.max,
+        }
+        for percent in PERCENTILES:
+            summary[f"p{percent}"] = self.percentile(sorted_samples, percent)
+        return summary
+
+
+class Instrumentation:
+    """Histograms and counters of where the time and tokens of a run go.
+
+    Recording a value is a dictionary lookup and a list append, cheap enough to leave
+    on for every run. Percentiles are only worked out when metrics are read. Set
+    GAIA_INSTRUMENTATION=0 to turn recording off altogether.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.histograms = {}
+        self.counters = {}
+
+    def observe(self, name, value):
+        if not self.enabled:
+            return
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.observe(value)
+
+    def increment(self, name, amount=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    @contextmanager
+    def timer(self, name):
+        """Observe the wall time of a block as name, in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def observe_usage(self, prefix, message):
+        """Observe the input, output and cache tokens of a model response"""
+        usage = getattr(message, "usage_metadata", None)
+        if not usage:
+            return
+        details = usage.get("input_token_details") or {}
+        self.observe(f"{prefix}_input_tokens", usage.get("input_tokens", 0))
+        self.observe(f"{prefix}_output_tokens", usage.get("output_tokens", 0))
+        self.observe(f"{prefix}_cache_read_tokens", details.get("cache_read") or 0)
+        self.observe(
+            f"{prefix}_cache_creation_tokens", details.get("cache_creation") or 0
+        )
+
+    def take(self):
+        """The values recorded so far, cleared so they're only taken once.
+
+        For sending what another process recorded to be merged into this one's, which
+        is exact as long as it's fewer values than a histogram keeps.
+        """
+        recorded = {
+            "histograms": {
+                name: histogram.samples for name, histogram in self.histograms.items()
+            },
+            "counters": self.counters,
+        }
+        self.histograms = {}
+        self.counters = {}
+        return recorded
+
+    def merge(self, recorded):
+        """Record the values taken from another process's instrumentation"""
+        for name, values in recorded["histograms"].items():
+            for value in values:
+                self.observe(name, value)
+        for name, amount in recorded["counters"].items():
+            self.increment(name, amount)
+
+    def summary(self):
+        return {
+            "histograms": {
+                name: histogram.summary()
+                for name, histogram in sorted(self.histograms.items())
+            },
+            "counters": dict(sorted(self.counters.items())),
+        }
+
+    def metrics(self):
+        """The summary flattened into mlflow metrics"""
+        summary = self.summary()
+        metrics = dict(summary["counters"])
+        for name, histogram in summary["histograms"].items():
+            for statistic, value in histogram.items():
+                metrics[f"{name}_{statistic}"] = value
+        return metrics
+
+
+instrumentation = Instrumentation(enabled=os.getenv("GAIA_INSTRUMENTATION", "1") == "1")
+
+
+class ToolTimingCallbackHandler(BaseCallbackHandler):
+    """Observes the wall time of every tool call, and counts the ones that fail"""
+
+    # Called directly rather than from a thread pool, as there's nothing to wait on
+    run_inline = True
+
+    def __init__(self):
+        self.started = {}
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        name = (serialized or {}).get("name") or kwargs.get("name", "unknown")
+        self.started[run_id] = (name, time.perf_counter())
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        name, start = self.started.pop(run_id, (None, None))
+        if name is not None:
+            instrumentation.observe(f"tool_{name}_seconds", time.perf_counter() - start)
+            instrumentation.increment(f"tool_{name}_calls")
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        name, start = self.started.pop(run_id, (None, None))
+        if name is not None:
+            instrumentation.observe(f"tool_{name}_seconds", time.perf_counter() - start)
+            instrumentation.increment(f"tool_{name}_errors")
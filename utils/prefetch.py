@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from utils import prefetch_worker
+from utils.file_extractors import FileExtractor, supported_file_types
+from utils.instrumentation import instrumentation
+
+logger = logging.getLogger(__name__)
+
+
+def is_supported(file_name):
+    extension = os.path.splitext(file_name)[1].lstrip(".").lower()
+    return extension in supported_file_types
+
+
+class AttachmentPrefetcher:
+    """Downloads and extracts the attachments of upcoming questions in worker processes.
+
+    Given the questions in the order they'll be answered, the next lookahead
+    attachments are extracted ahead of time, so transcription and parsing overlap
+    with other questions' LLM turns instead of holding up the event loop. The workers
+    share a budget of cpus cores, each limited to its share of threads. Results go
+    through the extraction cache as well, so a later run needn't extract them again,
+    and what the workers record of extraction is merged into this process's metrics.
+    """
+
+    def __init__(self, cpus=1, workers=1, lookahead=8):
+        self.lookahead = lookahead
+        threads = max(1, cpus // workers)
+        # Forking a process that has started threads and an event loop isn't safe
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=prefetch_worker.initialize_worker,
+            initargs=(threads,),
+        )
+        self.upcoming = []
+        self.futures = {}
+        logger.info(
+            f"Prefetching attachments with {workers} workers of {threads} threads"
+        )
+
+    @classmethod
+    def from_env(cls, processes=1):
+        """Settings from the environment, with the CPU budget split between processes
+        running on the same machine, such as shards"""
+        cpus = max(1, os.cpu_count() // 2 // processes)
+        return cls(
+            cpus=int(os.getenv("GAIA_PREFETCH_CPUS", cpus)),
+            workers=int(os.getenv("GAIA_PREFETCH_WORKERS", 1)),
+            lookahead=int(os.getenv("GAIA_PREFETCH_LOOKAHEAD", 8)),
+        )
+
+    def start(self, questions):
+        """Queue the attachments of questions, in order, and start on the first ones"""
+        file_names = [
+            question["file_name"]
+            for question in questions
+            if is_supported(question["file_name"])
+        ]
+        # Each attachment once, in the order first needed
+        self.upcoming = list(dict.fromkeys(file_names))
+        self.upcoming.reverse()
+        self.schedule()
+
+    def schedule(self):
+        while self.upcoming and len(self.futures) < self.lookahead:
+            self.submit(self.upcoming.pop())
+
+    def submit(self, file_name):
+        if file_name not in self.futures:
+            self.futures[file_name] = self.executor.submit(
+                prefetch_worker.extract_attachment, file_name
+            )
+        return self.futures[file_name]
+
+    async def get(self, file_name):
+        """The extracted text of an attachment, waiting for it if it isn't ready"""
+        if not is_supported(file_name):
+            # Raises that the file type isn't supported, without a trip to a worker
+            return FileExtractor(file_name)()
+        if file_name in self.upcoming:
+            self.upcoming.remove(file_name)
+        future = self.submit(file_name)
+        instrumentation.increment(
+            "prefetch_ready" if future.done() else "prefetch_not_ready"
+        )
+        start = time.perf_counter()
+        try:
+            text, recorded = await asyncio.wrap_future(future)
+        finally:
+            instrumentation.observe(
+                "prefetch_wait_seconds", time.perf_counter() - start
+            )
+            # Questions that share an attachment wait on the same future, and only
+            # the first of them to finish removes it and merges what it recorded
+            is_first = self.futures.get(file_name) is future
+            if is_first:
+                del self.futures[file_name]
+            self.schedule()
+        if is_first:
+            instrumentation.merge(recorded)
+        return text
+
+    def shutdown(self):
+        self.executor.shutdown(cancel_futures=True)
@@ -0,0 +1,29 @@
+"""Entry point of the attachment prefetcher's worker processes.
+
+The pool runs the functions here, which only import what extraction needs. A spawned
+process also imports its parent's main module first, so main.py keeps the agent out
+of its module-level imports.
+"""
+
+import os
+
+from utils.instrumentation import instrumentation
+
+
+def initialize_worker(threads):
+    # Set before torch is imported, so transcription stays within its share of the
+    # CPU budget
+    for variable in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "GAIA_WHISPER_THREADS"):
+        os.environ[variable] = str(threads)
+
+
+def extract_attachment(file_name):
+    """Download and extract an attachment, with what was recorded while doing so.
+
+    Extraction records cache hits and timings in this process's instrumentation, so
+    they're sent back with the text to be merged into the parent's.
+    """
+    from utils.file_extractors import FileExtractor
+
+    text = FileExtractor(file_name)()
+    return text, instrumentation.take()
@@ -1,3 +1,4 @@
+import hashlib
 import json
 import os
 import logging
@@ -6,6 +7,12 @@ from datasets import load_dataset
 logger = logging.getLogger(__name__)
 
 
+def shard_of(task_id, shard_count):
+    """The shard a question belongs to, the same in every process and on every machine"""
+    digest = hashlib.sha256(task_id.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % shard_count
+
+
 class QuestionProvider:
     def __init__(self):
         self.gaia = load_dataset(
@@ -36,11 +43,14 @@ class QuestionProvider:
     def get_question_count(self):
         return len(self.gaia)
 
-    def get_questions(self):
+    def get_questions(self, shard=None):
+        """The questions and their answers, or only those of shard (index, count)"""
         questions = self.gaia
         formatted_questions = []
         answers = []
         for question in questions:
+            if shard and shard_of(question["task_id"], shard[1]) != shard[0]:
+                continue
             formatted_question, answer = self.format_question(question)
             formatted_questions.append(formatted_question)
             answers.append(answer)
@@ -48,26 +58,69 @@ class QuestionProvider:
 
 
 class AnswerFileWriter:
+    """Appends each answer to a JSONL log as a single write, flushed to disk.
+
+    Every record is one os.write to a file opened with O_APPEND, so concurrent writers,
+    whether coroutines, threads or processes, never interleave within a line. A crash
+    can at most leave a partial last line, which is skipped when reading.
+    """
+
     def __init__(self, answers_save_file):
         self.answers_save_file = answers_save_file
         logger.info(f"Initializing answer save file at {self.answers_save_file}")
+        self.terminate_partial_line()
+
+    def terminate_partial_line(self):
+        # A crash mid-write leaves a last line without a newline, and the next record
+        # must not be appended onto it
+        if not os.path.exists(self.answers_save_file):
+            return
+        with open(self.answers_save_file, "rb+") as f:
+            if f.seek(0, os.SEEK_END) == 0:
+                return
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
 
     def __call__(self, answer_data):
         logger.info("Preparing to write to answers file...")
 
-        if os.path.exists(self.answers_save_file):
-            with open(self.answers_save_file, "r") as f:
+        line = (json.dumps(answer_data) + "\n").encode("utf-8")
+        fd = os.open(
+            self.answers_save_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644
+        )
+        try:
+            os.write(fd, line)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+        logger.info("Answer file updated...")
+
+    def read(self):
+        if not os.path.exists(self.answers_save_file):
+            return []
+        answers = []
+        with open(self.answers_save_file, "r") as f:
+            for line in f:
                 try:
-                    data = json.load(f)
+                    answers.append(json.loads(line))
                 except json.JSONDecodeError:
-                    data = {}
-        else:
-            data = {}
-        if "answers" not in data or not isinstance(data["answers"], list):
-            data["answers"] = []
-
-        data["answers"].append(answer_data)
-        with open(self.answers_save_file, "w") as f:
-            json.dump(data, f, indent=2)
+                    logger.warning(
+                        f"Skipping unreadable line in {self.answers_save_file}"
+                    )
+        return answers
 
-        logger.info("Answer file updated...")
+    def finalize(self, json_file=None):
+        """Write the answers in the {"answers": [...]} JSON layout and return its path"""
+        json_file = json_file or os.path.splitext(self.answers_save_file)[0] + ".json"
+        temporary_file = f"{json_file}.tmp"
+        # A resumed run may have retried a question, in which case its latest
+        # answer replaces the earlier one
+        answers = {}
+        for answer in self.read():
+            answers[answer["task_id"]] = answer
+        with open(temporary_file, "w") as f:
+            json.dump({"answers": list(answers.values())}, f, indent=2)
+        os.replace(temporary_file, json_file)
+        return json_file
@@ -3,31 +3,36 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+def print_text(text):
+    print(text, end="", flush=True)
+
+
 class MessageChunkPrinter:
+    """Prints the model's streamed output, or passes it to write if given one"""
+
+    def __init__(self, write=print_text):
+        self.write = write
+
     def handle_thinking_type_contents(self, contents):
         if "thinking" in contents:
-            print(
-                contents["thinking"],
-                end="",
-                flush=True,
-            )
+            self.write(contents["thinking"])
         elif "signature" in contents:
             pass
         else:
-            print(f"unknown thinking node {contents}")
+            self.write(f"unknown thinking node {contents}\n")
 
     def handle_typed_chunk_contents(self, contents):
         match contents["type"]:
             case "thinking":
                 self.handle_thinking_type_contents(contents)
             case "text":
-                print(contents["text"], end="", flush=True)
+                self.write(contents["text"])
             case "tool_use":
-                print(f"\n\nUsing {contents['name']}\n\n")
+                self.write(f"\n\nUsing {contents['name']}\n\n\n")
             case "input_json_delta":
                 pass
             case _:
-                print(f"unknown node {contents}")
+                self.write(f"unknown node {contents}\n")
 
     def handle_single_character_chunk_contents(self, contents, metadata):
         if "langgraph_node" in metadata:
@@ -35,13 +40,12 @@ class MessageChunkPrinter:
                 metadata["langgraph_node"] != "tools"
                 and metadata["langgraph_node"] != "consider_question"
             ):
-                print(contents)
-                print(metadata)
+                self.write(f"{contents}\n{metadata}\n")
             else:
                 pass
 
     def handle_unknown_chunk_contents(self, contents):
-        print(f"unknown node {contents} has no type")
+        self.write(f"unknown node {contents} has no type\n")
 
     def __call__(self, chunk):
         message_chunk, metadata = chunk
@@ -61,10 +65,10 @@ class MessageChunkPrinter:
                 # Don't print when the LLM stops for whatever reason
                 pass
             else:
-                print(
-                    f"unknown message chunk with no content, but metadata: {message_chunk.response_metadata}"
+                self.write(
+                    f"unknown message chunk with no content, but metadata: {message_chunk.response_metadata}\n"
                 )
         else:
-            print(
-                f"unknown message chunk has no content or response_metadata: {message_chunk}"
+            self.write(
+                f"unknown message chunk has no content or response_metadata: {message_chunk}\n"
             )
@@ -0,0 +1,234 @@
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+
+from utils.instrumentation import instrumentation
+
+logger = logging.getLogger(__name__)
+
+# log_batch accepts at most this many metrics per call
+MAX_BATCH_METRICS = 1000
+# A line of streamed output longer than this is written out before it ends
+MAX_LINE_CHARACTERS = 1000
+# Output held back for a question while the queue is full, beyond which it's dropped
+MAX_OVERFLOW_CHARACTERS = 10000
+PREFIX_CHARACTERS = 8
+OUTPUTS = ("prefixed", "files", "none")
+
+
+class TelemetrySink:
+    """Writes streamed model output and mlflow metrics from a background thread.
+
+    The event loop only ever puts chunks on a bounded queue and appends metrics to a
+    list, so it never waits on stdout or the tracking store. Every flush_seconds the
+    thread drains both, coalescing each question's chunks into whole lines and
+    sending the metrics in one log_batch. If it falls behind and the queue fills up,
+    a question's further chunks are coalesced into one, queued with its next chunk
+    once there's room, and past MAX_OVERFLOW_CHARACTERS dropped and counted rather
+    than waited for. Metrics are never dropped while the tracking store is reachable:
+    a batch that fails to send is sent again with the next flush, and only what still
+    fails when the sink closes is dropped and counted.
+
+    Output is written as whole lines, either to stdout prefixed with the start of the
+    question's task id, so concurrent questions can be told apart, or to one file per
+    question in log_directory.
+    """
+
+    def __init__(
+        self,
+        *,
+        output="prefixed",
+        log_directory=None,
+        run_id=None,
+        client=None,
+        max_queue_size=10000,
+        flush_seconds=0.2,
+    ):
+        if output not in OUTPUTS:
+            raise ValueError(f"Unknown output {output}, expected one of {OUTPUTS}")
+        if output == "files" and not log_directory:
+            raise ValueError("Writing output to files needs a log_directory")
+        self.output = output
+        self.log_directory = log_directory
+        self.run_id = run_id
+        self.client = client
+        self.flush_seconds = flush_seconds
+        self.chunks = queue.Queue(maxsize=max_queue_size)
+        # Appended to from the event loop and swapped out by the writer thread
+        self.lock = threading.Lock()
+        self.pending_metrics = []
+        self.ended_questions = []
+        # Only touched by the event loop
+        self.overflow = {}
+        self.dropped = {}
+        # Only touched by the writer thread
+        self.lines = {}
+        self.files = {}
+        self.retry_metrics = []
+        self.closed = threading.Event()
+        self.thread = threading.Thread(
+            target=self.run, name="telemetry-sink", daemon=True
+        )
+        self.thread.start()
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        return cls(
+            max_queue_size=int(os.getenv("GAIA_TELEMETRY_QUEUE_SIZE", 10000)),
+            flush_seconds=float(os.getenv("GAIA_TELEMETRY_FLUSH_SECONDS", 0.2)),
+            **kwargs,
+        )
+
+    def writer(self, task_id):
+        """A write function for a question's MessageChunkPrinter"""
+
+        def write(text):
+            self.write(task_id, text)
+
+        return write
+
+    def write(self, task_id, text):
+        if self.output == "none":
+            return
+        text = self.overflow.pop(task_id, "") + text
+        try:
+            self.chunks.put_nowait((task_id, text))
+        except queue.Full:
+            if len(text) <= MAX_OVERFLOW_CHARACTERS:
+                self.overflow[task_id] = text
+            else:
+                self.dropped[task_id] = self.dropped.get(task_id, 0) + len(text)
+                instrumentation.increment("telemetry_dropped_characters", len(text))
+
+    def end_question(self, task_id):
+        """Write out what's left of a question's output and close its file"""
+        if self.output == "none":
+            return
+        with self.lock:
+            self.ended_questions.append(
+                (
+                    task_id,
+                    self.overflow.pop(task_id, ""),
+                    self.dropped.pop(task_id, 0),
+                )
+            )
+
+    def log_metrics(self, metrics, step=None):
+        if self.client is None:
+            return
+        from mlflow.entities import Metric
+
+        timestamp = int(time.time() * 1000)
+        with self.lock:
+            self.pending_metrics.extend(
+                Metric(key, float(value), timestamp, step or 0)
+                for key, value in metrics.items()
+            )
+
+    def run(self):
+        while not self.closed.wait(self.flush_seconds):
+            self.flush()
+        # Whatever was queued before closing, with another try for metrics that
+        # failed to send
+        self.flush()
+        if self.retry_metrics:
+            self.send_metrics([])
+        if self.retry_metrics:
+            logger.warning(f"Dropped {len(self.retry_metrics)} unsent mlflow metrics")
+            instrumentation.increment(
+                "telemetry_dropped_metrics", len(self.retry_metrics)
+            )
+            self.retry_metrics = []
+
+    def flush(self):
+        # Questions are collected before their chunks, so every chunk of an ended
+        # question is already on the queue when it's drained below
+        with self.lock:
+            ended_questions, self.ended_questions = self.ended_questions, []
+            metrics, self.pending_metrics = self.pending_metrics, []
+
+        chunks = []
+        try:
+            while True:
+                chunks.append(self.chunks.get_nowait())
+        except queue.Empty:
+            pass
+        try:
+            self.write_chunks(chunks)
+            for task_id, overflow, dropped in ended_questions:
+                self.finish(task_id, overflow, dropped)
+            if self.output == "prefixed":
+                sys.stdout.flush()
+        except Exception as e:
+            logger.warning(f"Couldn't write streamed output: {e}")
+        self.send_metrics(metrics)
+
+    def write_chunks(self, chunks):
+        # Each question's chunks are joined up and written a line at a time
+        texts = {}
+        for task_id, text in chunks:
+            texts.setdefault(task_id, []).append(text)
+        for task_id, parts in texts.items():
+            text = self.lines.pop(task_id, "") + "".join(parts)
+            *complete, partial = text.split("\n")
+            if len(partial) > MAX_LINE_CHARACTERS:
+                complete.append(partial)
+                partial = ""
+            if complete:
+                self.write_lines(task_id, complete)
+            if partial:
+                self.lines[task_id] = partial
+
+    def write_lines(self, task_id, lines):
+        if self.output == "files":
+            file = self.files.get(task_id)
+            if file is None:
+                file = self.files[task_id] = open(
+                    os.path.join(self.log_directory, f"{task_id}.log"), "a"
+                )
+            file.write("".join(f"{line}\n" for line in lines))
+        else:
+            prefix = f"[{task_id[:PREFIX_CHARACTERS]}] "
+            sys.stdout.write("".join(f"{prefix}{line}\n" for line in lines))
+
+    def finish(self, task_id, overflow, dropped):
+        lines = (self.lines.pop(task_id, "") + overflow).split("\n")
+        if not lines[-1]:
+            lines.pop()
+        if dropped:
+            lines.append(f"({dropped} characters of output dropped)")
+        if lines:
+            self.write_lines(task_id, lines)
+        file = self.files.pop(task_id, None)
+        if file is not None:
+            file.close()
+
+    def send_metrics(self, metrics):
+        """Send metrics in batches, keeping any batch that fails to send again later"""
+        metrics = self.retry_metrics + metrics
+        self.retry_metrics = []
+        for start in range(0, len(metrics), MAX_BATCH_METRICS):
+            batch = metrics[start : start + MAX_BATCH_METRICS]
+            try:
+                self.client.log_batch(self.run_id, metrics=batch)
+            except Exception as e:
+                logger.warning(f"Couldn't log {len(batch)} metrics to mlflow: {e}")
+                instrumentation.increment("telemetry_failed_metric_batches")
+                self.retry_metrics.extend(batch)
+
+    def close(self):
+        """Write out everything still queued and stop the writer thread"""
+        for task_id in {*self.overflow, *self.dropped}:
+            self.end_question(task_id)
+        self.closed.set()
+        self.thread.join()
+        for task_id in list(self.lines):
+            self.finish(task_id, "", 0)
+        for file in self.files.values():
+            file.close()
+        self.files.clear()
+        if self.output == "prefixed":
+            sys.stdout.flush()
@@ -0,0 +1,149 @@
+import logging
+import os
+from functools import cache
+
+logger = logging.getLogger(__name__)
+
+WHISPER_MODEL = "openai/whisper-small"
+SAMPLING_RATE = 16000
+CHUNK_LENGTH_SECONDS = 30
+
+
+class TranscriptionConfig:
+    """How mp3 attachments are transcribed, read from the environment.
+
+    The default mode is the original fp32 pipeline run one 30s window at a time. The
+    cpu mode batches the windows, can dynamically quantize the model to int8, sets the
+    torch thread count and trims silence before transcribing.
+    """
+
+    def __init__(
+        self, mode="default", batch_size=8, quantize=True, threads=None, trim=True
+    ):
+        if mode not in ("default", "cpu"):
+            raise ValueError(f"Unknown transcription mode {mode}")
+        self.mode = mode
+        self.batch_size = batch_size
+        self.quantize = quantize
+        self.threads = threads
+        self.trim = trim
+
+    @classmethod
+    def from_env(cls):
+        threads = os.getenv("GAIA_WHISPER_THREADS")
+        return cls(
+            mode=os.getenv("GAIA_TRANSCRIPTION_MODE", "default"),
+            batch_size=int(os.getenv("GAIA_WHISPER_BATCH_SIZE", 8)),
+            quantize=os.getenv("GAIA_WHISPER_QUANTIZE", "1") == "1",
+            threads=int(threads) if threads else None,
+            trim=os.getenv("GAIA_WHISPER_TRIM_SILENCE", "1") == "1",
+        )
+
+    def cache_tag(self):
+        """Identifies the settings that change the transcript, for the extraction cache"""
+        if self.mode == "default":
+            return "default"
+        return f"cpu-q{int(self.quantize)}-t{int(self.trim)}"
+
+
+@cache
+def get_whisper():
+    import torch
+    from transformers import pipeline
+
+    logger.info("Loading whisper speech recognition pipeline...")
+    device = "cuda:0" if torch.cuda.is_available() else "cpu"
+    return pipeline(
+        "automatic-speech-recognition",
+        WHISPER_MODEL,
+        chunk_length_s=CHUNK_LENGTH_SECONDS,
+        device=device,
+    )
+
+
+@cache
+def get_cpu_whisper(quantize):
+    import torch
+    from transformers import (
+        WhisperForConditionalGeneration,
+        WhisperProcessor,
+        pipeline,
+    )
+
+    logger.info(f"Loading CPU whisper pipeline (int8 quantized: {quantize})...")
+    processor = WhisperProcessor.from_pretrained(WHISPER_MODEL)
+    model = WhisperForConditionalGeneration.from_pretrained(WHISPER_MODEL).eval()
+    if quantize:
+        # Dynamic quantization keeps weights in int8 and quantizes activations on the
+        # fly, which suits the Linear-heavy Whisper decoder on CPU
+        model = torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+    return pipeline(
+        "automatic-speech-recognition",
+        model=model,
+        tokenizer=processor.tokenizer,
+        feature_extractor=processor.feature_extractor,
+        chunk_length_s=CHUNK_LENGTH_SECONDS,
+        device="cpu",
+    )
+
+
+def load_audio(file_path):
+    from transformers.pipelines.audio_utils import ffmpeg_read
+
+    with open(file_path, "rb") as file:
+        return ffmpeg_read(file.read(), SAMPLING_RATE)
+
+
+def trim_silence(audio, frame_seconds=0.03, threshold_ratio=0.1, padding_seconds=0.3):
+    """Drop silent stretches using frame energy as a simple voice activity detector.
+
+    A frame is voiced when its RMS energy is above threshold_ratio of the loudest
+    frame's. Voiced frames keep padding_seconds of audio either side so word onsets
+    and endings are not clipped.
+    """
+    import numpy as np
+
+    frame_length = int(SAMPLING_RATE * frame_seconds)
+    frame_count = len(audio) // frame_length
+    if frame_count == 0:
+        return audio
+    frames = audio[: frame_count * frame_length].reshape(frame_count, frame_length)
+    energy = np.sqrt(np.mean(frames**2, axis=1))
+    voiced = energy > energy.max() * threshold_ratio
+    if not voiced.any():
+        return audio
+
+    padding = int(padding_seconds / frame_seconds)
+    # Widen every voiced frame by the padding on both sides
+    kernel = np.ones(2 * padding + 1, dtype=bool)
+    voiced = np.convolve(voiced, kernel, mode="same") > 0
+    mask = np.repeat(voiced, frame_length)
+    trimmed = audio[: len(mask)][mask]
+    logger.info(
+        f"Trimmed {(len(audio) - len(trimmed)) / SAMPLING_RATE:.1f}s of silence"
+    )
+    return trimmed
+
+
+def transcribe(file_path, config=None):
+    config = config or TranscriptionConfig.from_env()
+    if config.mode == "default":
+        return get_whisper()(file_path, return_timestamps=True)["text"]
+
+    import torch
+
+    if config.threads:
+        torch.set_num_threads(config.threads)
+    audio = load_audio(file_path)
+    if config.trim:
+        audio = trim_silence(audio)
+    whisper = get_cpu_whisper(config.quantize)
+    with torch.inference_mode():
+        result = whisper(
+            {"raw": audio, "sampling_rate": SAMPLING_RATE},
+            batch_size=config.batch_size,
+            return_timestamps=True,
+        )
+    return result["text"]